@@ -0,0 +1,52 @@
+"""
+Measures the import time of revault and the time of opening stores.
+
+    $ python benchmarks/startup.py [DB_URL]
+"""
+
+import subprocess
+import sys
+import tempfile
+import time
+import os
+
+
+def measure_import(repeat: int = 5) -> float:
+    code = (
+        "import time; s = time.perf_counter(); "
+        "import revault; print(time.perf_counter() - s)"
+    )
+    times = [
+        float(subprocess.check_output([sys.executable, "-c", code]))
+        for _ in range(repeat)
+    ]
+    return min(times)
+
+
+def measure_store_open(url: str, count: int) -> tuple[float, float]:
+    from revault import Store
+
+    start = time.perf_counter()
+    Store(url)
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        Store(url)
+    return first, (time.perf_counter() - start) / count
+
+
+def main():
+    print(f"import revault: {measure_import() * 1000:.2f} ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        if len(sys.argv) > 1:
+            url = sys.argv[1]
+        else:
+            url = "sqlite:///" + os.path.join(tmp, "bench.db")
+        first, other = measure_store_open(url, 100)
+        print(f"first Store(): {first * 1000:.2f} ms")
+        print(f"next Store(): {other * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from .comp import computation, Ref, ToKey, to_key
-from .store import Store, get_current_store
+from .store import Store, get_current_store, checkpoint, last_checkpoint
 from .key import Key
 
 __all__ = [
@@ -12,4 +12,6 @@ __all__ = [
     "Ref",
     "to_key",
     "ToKey",
+    "checkpoint",
+    "last_checkpoint",
 ]
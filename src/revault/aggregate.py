@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+AGGREGATIONS = ("count", "sum", "mean", "min", "max")
+
+
+@dataclass(frozen=True)
+class Metric:
+    """
+    Aggregation of a value found at a path in a config or a result,
+    e.g. `Metric("acc", "mean", "result", ("accuracy",))`.
+    """
+
+    name: str
+    function: str
+    source: str | None  # "config", "result", or None for counting rows
+    path: tuple[str, ...]
+
+
+def parse_path(path: str) -> tuple[str, tuple[str, ...]]:
+    source, *rest = path.split(".")
+    if source not in ("config", "result"):
+        raise Exception(f"Path has to start with 'config' or 'result', got: {path!r}")
+    return source, tuple(rest)
+
+
+def parse_metrics(metrics: dict[str, str | tuple[str, str | None]]) -> list[Metric]:
+    """
+    Metrics are given as `{name: (function, path)}`, or as `{function: path}`
+    when the name of the output is the function itself, e.g.:
+
+    >>> parse_metrics({"mean": "result.accuracy", "n": ("count", None)})
+    """
+    result = []
+    for name, spec in metrics.items():
+        if isinstance(spec, tuple):
+            function, path = spec
+        else:
+            function, path = name, spec
+        if function not in AGGREGATIONS:
+            raise Exception(
+                f"Invalid aggregation {function!r}, expected one of {AGGREGATIONS}"
+            )
+        if path is None:
+            if function != "count":
+                raise Exception(f"Aggregation {function!r} needs a path")
+            source, path = None, ()
+        else:
+            source, path = parse_path(path)
+        result.append(Metric(name, function, source, path))
+    return result
+
+
+def get_path(obj: Any, path: tuple[str, ...]) -> Any:
+    for name in path:
+        if obj is None:
+            return None
+        if isinstance(obj, dict):
+            obj = obj.get(name)
+        else:
+            obj = getattr(obj, name, None)
+    return obj
+
+
+class _MetricState:
+    __slots__ = ("count", "sum", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, function: str, value):
+        # Like the SQL path, numbers are aggregated as floats
+        numeric = isinstance(value, (int, float))
+        if function in ("sum", "mean"):
+            if not numeric:
+                return
+            self.count += 1
+            self.sum += value
+            return
+        if numeric:
+            value = float(value)
+        try:
+            if function == "min":
+                if self.min is None or value < self.min:
+                    self.min = value
+            elif self.max is None or value > self.max:
+                self.max = value
+        except TypeError:
+            return  # Not comparable with previous values
+        self.count += 1
+
+    def value(self, function: str):
+        if function == "mean":
+            return self.sum / self.count if self.count else None
+        if function == "sum":
+            return self.sum if self.count else None
+        return getattr(self, function)
+
+
+def aggregate_stream(
+    rows: Iterable[tuple[dict, Any]], group_by: list[str], metrics: list[Metric]
+) -> list[dict]:
+    """
+    Aggregates (config, result) pairs in a single pass, keeping only one
+    state per group and metric in memory.
+    """
+    groups: dict[tuple, list[_MetricState]] = {}
+    for config, result in rows:
+        group = tuple(config.get(name) for name in group_by)
+        states = groups.get(group)
+        if states is None:
+            states = [_MetricState() for _ in metrics]
+            groups[group] = states
+        for metric, state in zip(metrics, states):
+            if metric.source is None:
+                state.count += 1
+                continue
+            value = get_path(
+                config if metric.source == "config" else result, metric.path
+            )
+            if value is None:
+                continue
+            if metric.function == "count":
+                state.count += 1
+            else:
+                state.add(metric.function, value)
+    if not groups and not group_by:
+        # Same as SQL, aggregation without grouping gives a single row
+        groups[()] = [_MetricState() for _ in metrics]
+    return [
+        dict(
+            zip(group_by, group),
+            **{m.name: s.value(m.function) for m, s in zip(metrics, states)},
+        )
+        for group, states in groups.items()
+    ]
@@ -0,0 +1,195 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Iterator, Sequence, Tuple
+
+from .aggregate import Metric, aggregate_stream
+from .blobs import Blob
+from .entry import AnnounceResult, EntryId, Entry, TaskId
+from .key import Key
+
+
+class Backend(ABC):
+    """
+    Storage used by Store.
+
+    The backend is selected by the URL passed to Store:
+
+    * ``memory://`` -- dictionaries in the current process (see MemoryBackend)
+    * ``file:///path/to/file`` -- append-only log file (see FileBackend)
+    * anything else is an SQLAlchemy database URL (see Database)
+    """
+
+    def init(self):
+        pass
+
+    @abstractmethod
+    def get_or_announce_entry(
+        self, key: Key, expect_missing: bool = False
+    ) -> Tuple[AnnounceResult, EntryId, Any]:
+        """
+        `expect_missing` is a hint that the key is probably not in the database,
+        so the backend may try to announce it before looking it up.
+        """
+
+    @abstractmethod
+    def finish_entry(
+        self,
+        entry_id: EntryId,
+        result: Any,
+        run_info: dict,
+        config: dict,
+        config_json: Any = None,
+        result_json: Any = None,
+        blob: Blob | None = None,
+    ):
+        """
+        Stores the result of an announced entry. When `blob` is given,
+        the serialized result is stored once per digest and shared by entries.
+        """
+
+    @abstractmethod
+    def cancel_entry(self, entry_id: EntryId): ...
+
+    @abstractmethod
+    def cancel_running(self): ...
+
+    @abstractmethod
+    def load_entry(self, key: Key) -> Entry | None: ...
+
+    @abstractmethod
+    def load_replica_entries(self, key: Key) -> list[Entry]: ...
+
+    def load_replicas_many(
+        self, keys: Sequence[Key], threads: int = 1
+    ) -> dict[Key, list[Any]]:
+        """
+        Returns results of all finished replicas of each key (ordered by replica).
+        The replica of the given keys is ignored.
+        """
+        return {
+            key: [entry.result for entry in self.load_replica_entries(key)]
+            for key in keys
+        }
+
+    @abstractmethod
+    def has_entry(self, key: Key) -> bool:
+        """Returns True if the key has a finished entry"""
+
+    @abstractmethod
+    def load_key_tuples(self, names: list[str] | None) -> Iterator[tuple]:
+        """Yields Key.tuple_key of all finished entries (of given names)"""
+
+    @abstractmethod
+    def load_all_keys(self) -> list[Key]: ...
+
+    @abstractmethod
+    def query_keys(self, name: str, version: int) -> list[Key]: ...
+
+    @abstractmethod
+    def iter_entries(self, name: str, version: int) -> Iterator[Tuple[dict, Any]]:
+        """Yields (config, result) of all finished entries of a computation"""
+
+    @abstractmethod
+    def iter_entry_chunks(
+        self,
+        name: str,
+        version: int,
+        fields: Sequence[str],
+        replica: int | None,
+        chunk_size: int,
+    ) -> Iterator[Sequence[tuple]]:
+        """
+        Yields lists of tuples with values of `fields` (see frame.ENTRY_FIELDS)
+        of finished entries, optionally only for the given replica.
+        """
+
+    def aggregate(
+        self,
+        name: str,
+        version: int,
+        group_by: list[str],
+        metrics: list[Metric],
+        json_config: bool,
+        json_result: bool,
+    ) -> list[dict]:
+        return aggregate_stream(self.iter_entries(name, version), group_by, metrics)
+
+    @abstractmethod
+    def remove(self, key: Key): ...
+
+    @abstractmethod
+    def remove_where(
+        self,
+        name: str | None,
+        version: int | None,
+        version_lt: int | None,
+        finished_before: datetime | None,
+    ) -> int:
+        """
+        Removes finished entries matching all given conditions and returns
+        their count. Unfinished entries are left to cancel_running.
+        Checkpoints are removed too, unless `finished_before` is used.
+        """
+
+    @abstractmethod
+    def list_versions(self, name: str) -> list[int]: ...
+
+    def explain(self, query: Any) -> list[str]:
+        raise Exception(f"Explain is not supported by {self.__class__.__name__}")
+
+    def compact(self, full: bool = False) -> int:
+        """Reclaims unused space and returns the number of freed bytes"""
+        return 0
+
+    @abstractmethod
+    def insert_new_replica(self, key: Key, result: Any) -> int: ...
+
+    @abstractmethod
+    def save_checkpoint(self, key: Key, data: bytes): ...
+
+    @abstractmethod
+    def load_checkpoint(self, key: Key) -> bytes | None: ...
+
+    @abstractmethod
+    def remove_checkpoint(self, key: Key): ...
+
+    @abstractmethod
+    def enqueue(self, keys: list[Key]) -> int: ...
+
+    @abstractmethod
+    def claim_task(
+        self, worker: str, lease: float | None = None
+    ) -> Tuple[TaskId, Key] | None:
+        """
+        Claims a queued task. With `lease` (in seconds), tasks without error
+        whose claim is older than the lease are claimed again, and the unfinished
+        entry of the previous claimer is removed.
+        """
+
+    @abstractmethod
+    def renew_task(self, task_id: TaskId):
+        """Renews the claim of a running task"""
+
+    @abstractmethod
+    def requeue_failed_tasks(self, name: str | None) -> int:
+        """Makes failed tasks (of computation with given name) claimable again"""
+
+    @abstractmethod
+    def finish_task(self, task_id: TaskId): ...
+
+    @abstractmethod
+    def fail_task(self, task_id: TaskId, error: str): ...
+
+
+def create_backend(url: str) -> Backend:
+    if url.startswith("memory://"):
+        from .memory import MemoryBackend
+
+        return MemoryBackend()
+    if url.startswith("file://"):
+        from .memory import FileBackend
+
+        return FileBackend(url[len("file://") :])
+    from .database import Database
+
+    return Database(url)
@@ -0,0 +1,39 @@
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any
+
+Blob = tuple[str, bytes]
+
+
+def make_blob(obj: Any) -> Blob:
+    """Serializes an object and returns (sha256 hexdigest, data)"""
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    return hashlib.sha256(data).hexdigest(), data
+
+
+class BlobCache:
+    """
+    LRU cache of deserialized blobs.
+
+    Entries that share a blob get the same object, so results loaded
+    from blobs should not be modified.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.lock = threading.Lock()
+        self.objects: OrderedDict[str, Any] = OrderedDict()
+
+    def load(self, digest: str, data: bytes) -> Any:
+        with self.lock:
+            if digest in self.objects:
+                self.objects.move_to_end(digest)
+                return self.objects[digest]
+        obj = pickle.loads(data)
+        with self.lock:
+            self.objects[digest] = obj
+            if len(self.objects) > self.size:
+                self.objects.popitem(last=False)
+        return obj
@@ -0,0 +1,73 @@
+import logging
+import threading
+from typing import Callable
+
+from .key import Key
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointWriter:
+    """
+    Writes checkpoints in a background thread.
+
+    Only the last checkpoint of each key is kept while waiting for the write,
+    so a computation that checkpoints faster than the database can store
+    is never blocked.
+    """
+
+    def __init__(self, save: Callable[[Key, bytes], None]):
+        self.save = save
+        self.condition = threading.Condition()
+        self.pending: dict[Key, bytes] = {}
+        self.writing: tuple[Key, bytes] | None = None
+        self.errors: dict[Key, BaseException] = {}
+        self.thread = None
+
+    def write(self, key: Key, data: bytes):
+        with self.condition:
+            self.pending[key] = data
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="revault-checkpoints", daemon=True
+                )
+                self.thread.start()
+            self.condition.notify_all()
+
+    def get(self, key: Key) -> bytes | None:
+        """Returns a checkpoint that has not been written yet"""
+        with self.condition:
+            data = self.pending.get(key)
+            if data is None and self.writing is not None and self.writing[0] == key:
+                data = self.writing[1]
+            return data
+
+    def flush(self, key: Key):
+        """Waits until the checkpoint of the key is stored"""
+        with self.condition:
+            while key in self.pending or (
+                self.writing is not None and self.writing[0] == key
+            ):
+                self.condition.wait()
+            error = self.errors.pop(key, None)
+        if error is not None:
+            raise error
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                key = next(iter(self.pending))
+                data = self.pending.pop(key)
+                self.writing = (key, data)
+            try:
+                self.save(key, data)
+            except BaseException as e:
+                logger.exception("Writing checkpoint of %s failed", key)
+                with self.condition:
+                    self.errors[key] = e
+            finally:
+                with self.condition:
+                    self.writing = None
+                    self.condition.notify_all()
@@ -0,0 +1,71 @@
+import argparse
+import importlib
+import logging
+
+from .store import Store
+from .worker import run_worker
+
+
+def _worker(args):
+    for module in args.imports:
+        importlib.import_module(module)
+    count = run_worker(
+        Store(args.db_url),
+        name=args.name,
+        max_tasks=args.max_tasks,
+        poll_interval=args.poll,
+        lease=args.lease,
+    )
+    print(f"Processed tasks: {count}")
+
+
+def _requeue(args):
+    count = Store(args.db_url).requeue_failed_tasks(args.name)
+    print(f"Requeued tasks: {count}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="revault")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    worker = subparsers.add_parser("worker", help="Compute tasks from the queue")
+    worker.add_argument("db_url")
+    worker.add_argument(
+        "-i",
+        "--import",
+        dest="imports",
+        action="append",
+        default=[],
+        metavar="MODULE",
+        help="Module defining computations (can be used repeatedly)",
+    )
+    worker.add_argument("--name", default=None, help="Worker name")
+    worker.add_argument("--max-tasks", type=int, default=None)
+    worker.add_argument(
+        "--poll",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Wait for new tasks instead of exiting on an empty queue",
+    )
+    worker.add_argument(
+        "--lease",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Take over tasks of workers that did not renew their claim for so long",
+    )
+    worker.set_defaults(fn=_worker)
+
+    requeue = subparsers.add_parser("requeue", help="Requeue failed tasks")
+    requeue.add_argument("db_url")
+    requeue.add_argument("--name", default=None, help="Name of computation")
+    requeue.set_defaults(fn=_requeue)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from typing import Any, Callable, Iterable
+from typing import Any, Callable, Iterable, Iterator, Sequence
 import inspect
 
 from .entry import Entry
@@ -34,6 +34,99 @@ def to_key(obj: ToKey) -> Key:
     raise Exception(f"Expected Ref, CompRef, or Entry, got: {obj.__type__}")
 
 
+def _make_generic_binder(signature: inspect.Signature, varkw: str | None):
+    def bind(args: tuple, kwargs: dict) -> dict:
+        ba = signature.bind(*args, **kwargs)
+        ba.apply_defaults()
+        args = ba.arguments
+        if varkw:
+            kwargs = args.pop(varkw, {})
+            args.update(kwargs)
+        return args
+
+    return bind
+
+
+def _make_binder(signature: inspect.Signature, argspec: inspect.FullArgSpec):
+    """
+    Returns a function (args, kwargs) -> dict that gives the same result as
+    Signature.bind + apply_defaults + merging of **kwargs, but with the layout of
+    the parameters resolved ahead of time.
+    """
+    params = signature.parameters.values()
+    varkw = next((p.name for p in params if p.kind == p.VAR_KEYWORD), None)
+    # The argspec differs from the signature for bound methods, callable objects
+    # and wrapped functions; the layout is taken from the signature, but **kwargs
+    # are merged by the name from the argspec, so they have to agree
+    if varkw != argspec.varkw or any(
+        p.kind in (p.POSITIONAL_ONLY, p.VAR_POSITIONAL) for p in params
+    ):
+        return _make_generic_binder(signature, argspec.varkw)
+
+    positional = tuple(p.name for p in params if p.kind == p.POSITIONAL_OR_KEYWORD)
+    n_positional = len(positional)
+    names = tuple(p.name for p in params if p.kind != p.VAR_KEYWORD)
+    allowed = frozenset(names)
+    defaults = {p.name: p.default for p in params if p.default is not p.empty}
+
+    def bind(args: tuple, kwargs: dict) -> dict:
+        if len(args) > n_positional:
+            raise TypeError("too many positional arguments")
+        values = dict(zip(positional, args))
+        extra = None
+        for name, value in kwargs.items():
+            if name in allowed:
+                if name in values:
+                    raise TypeError(f"multiple values for argument '{name}'")
+                values[name] = value
+            elif varkw:
+                if extra is None:
+                    extra = {}
+                extra[name] = value
+            else:
+                raise TypeError(f"got an unexpected keyword argument '{name}'")
+        result = {}
+        for name in names:
+            if name in values:
+                result[name] = values[name]
+            elif name in defaults:
+                result[name] = defaults[name]
+            else:
+                raise TypeError(f"missing a required argument: '{name}'")
+        if extra:
+            result.update(extra)
+        return result
+
+    return bind
+
+
+_MEMO_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+def _memo_key(args: tuple, kwargs: dict) -> tuple | None:
+    # Types are part of the key, because e.g. 1, 1.0 and True are equal
+    # but their reprs (and hence config keys) differ
+    types = tuple(type(v) for v in args)
+    kw_types = tuple(type(v) for v in kwargs.values())
+    if not _MEMO_TYPES.issuperset(types) or not _MEMO_TYPES.issuperset(kw_types):
+        return None
+    if float in types or float in kw_types:
+        # 0.0 and -0.0 are equal (with equal hashes) but their reprs differ
+        args = tuple(repr(v) if type(v) is float else v for v in args)
+        kwargs = {k: repr(v) if type(v) is float else v for k, v in kwargs.items()}
+    return args, types, tuple(kwargs.items()), kw_types
+
+
+_REGISTRY: dict[tuple[str, int], "Computation"] = {}
+
+
+def get_computation(name: str, version: int) -> "Computation":
+    computation = _REGISTRY.get((name, version))
+    if computation is None:
+        raise Exception(f"Computation '{name}' v={version} is not registered")
+    return computation
+
+
 class Computation:
     def __init__(
         self,
@@ -42,6 +135,8 @@ class Computation:
         version: int,
         json_inputs: bool,
         json_result: bool,
+        key_memo_size: int = 0,
+        dedup_result: bool = False,
     ):
         assert isinstance(fn, Callable)
         self.fn = fn
@@ -50,12 +145,24 @@ class Computation:
         self.fn_argspec = inspect.getfullargspec(fn)
         self.json_inputs = json_inputs
         self.json_result = json_result
+        self.dedup_result = dedup_result
         self.name = name or fn.__name__
 
+        self._bind = _make_binder(self.fn_signature, self.fn_argspec)
+        self._filter_config = self.fn_argspec.varkw is not None or any(
+            name.startswith("__") for name in self.fn_signature.parameters
+        )
+        self.key_memo_size = key_memo_size
+        self._key_memo: dict[tuple, tuple[Key, dict]] | None = (
+            {} if key_memo_size > 0 else None
+        )
+
         self.__signature__ = self.fn_signature
         if hasattr(self.fn, "__name__"):
             self.__name__ = self.name
 
+        _REGISTRY[(self.name, self.version)] = self
+
     def __repr__(self):
         return f"<Computation '{self.name}' v={self.version}>"
 
@@ -74,17 +181,31 @@ class Computation:
     def ref(self, *args, version=None, replica=0, **kwargs) -> Ref:
         if version is None:
             version = self.version
-        ba = self.fn_signature.bind(*args, **kwargs)
-        ba.apply_defaults()
-        args = ba.arguments
-        if self.fn_argspec.varkw:
-            kwargs = args.pop(self.fn_argspec.varkw, {})
-            args.update(kwargs)
-        config = {}
-        for name in args:
-            if not name.startswith("__"):
-                config[name] = args[name]
-        return Ref(Key(self.name, version, config, replica), self, args)
+        memo = self._key_memo
+        if memo is not None:
+            memo_key = _memo_key(args, kwargs)
+            if memo_key is not None:
+                memo_key = (memo_key, version, replica)
+                cached = memo.get(memo_key)
+                if cached is not None:
+                    return Ref(cached[0], self, cached[1].copy())
+        else:
+            memo_key = None
+        call_args = self._bind(args, kwargs)
+        if self._filter_config:
+            config = {
+                name: value
+                for name, value in call_args.items()
+                if not name.startswith("__")
+            }
+        else:
+            config = call_args.copy()
+        key = Key(self.name, version, config, replica)
+        if memo_key is not None:
+            if len(memo) >= self.key_memo_size:
+                memo.clear()
+            memo[memo_key] = (key, call_args.copy())
+        return Ref(key, self, call_args)
 
     def replicas_refs(
         self, replicas: int | Iterable[int], *args, **kwargs
@@ -97,9 +218,43 @@ class Computation:
         store = get_current_store()
         return [store.get(ref) for ref in self.replicas_refs(replicas, *args, **kwargs)]
 
+    def iter_replicas(
+        self,
+        replicas: int | Iterable[int],
+        *args,
+        parallel: int = 1,
+        until: Callable[[list[Entry]], bool] | None = None,
+        **kwargs,
+    ) -> Iterator[Entry]:
+        """
+        Yields entries of replicas as soon as each of them is stored,
+        computing up to `parallel` replicas in threads.
+        Stops starting new replicas when `until(entries)` returns True, e.g.:
+
+        >>> enough = lambda entries: len(entries) >= 10
+        >>> for entry in comp.iter_replicas(100, x=1, parallel=4, until=enough):
+        ...     print(entry.result)
+        """
+        return get_current_store().iter_completed(
+            self.replicas_refs(replicas, *args, **kwargs), parallel, until
+        )
+
     def load_replicas(self, *args, **kwargs):
         return get_current_store().load_replicas(self.ref(*args, **kwargs))
 
+    def load_grid(self, configs: Iterable[dict], threads: int = 4) -> dict[Key, list]:
+        """
+        Loads results of all replicas for each config (a dict of arguments),
+        with one query per chunk of configs, e.g.:
+
+        >>> grid = [{"x": x, "y": y} for x in range(10) for y in range(10)]
+        >>> for key, results in comp.load_grid(grid).items():
+        ...     print(key.config["x"], key.config["y"], results)
+        """
+        return get_current_store().load_replicas_many(
+            [self.ref(**config) for config in configs], threads
+        )
+
     def load_entry(self, *args, **kwargs):
         return get_current_store().load_entry(self.ref(*args, **kwargs))
 
@@ -109,12 +264,72 @@ class Computation:
     def remove(self, *args, **kwargs):
         return get_current_store().remove(self.ref(*args, **kwargs))
 
+    def prune_versions(self, keep: int = 1) -> int:
+        """
+        Removes entries of older versions of the computation, keeping the `keep`
+        newest stored versions up to the current version.
+        Returns the number of removed entries.
+        """
+        assert keep >= 1
+        store = get_current_store()
+        versions = [v for v in store.list_versions(self.name) if v <= self.version]
+        if len(versions) <= keep:
+            return 0
+        return store.remove_where(self.name, version_lt=versions[-keep])
+
     def load_entry_or_none(self, *args, **kwargs):
         return get_current_store().load_entry_or_none(self.ref(*args, **kwargs))
 
     def load_or_none(self, *args, **kwargs):
         return get_current_store().load_or_none(self.ref(*args, **kwargs))
 
+    def exists(self, *args, **kwargs) -> bool:
+        return get_current_store().contains(self.ref(*args, **kwargs))
+
+    def enqueue(self, *args, **kwargs) -> int:
+        return get_current_store().enqueue([self.ref(*args, **kwargs)])
+
+    def enqueue_replicas(self, replicas: int | Iterable[int], *args, **kwargs) -> int:
+        return get_current_store().enqueue(
+            self.replicas_refs(replicas, *args, **kwargs)
+        )
+
+    def aggregate(
+        self, group_by: list[str] | None = None, metrics: dict | None = None
+    ) -> list[dict]:
+        """
+        Aggregates finished entries grouped by config fields, e.g.:
+
+        >>> comp.aggregate(group_by=["lr"], metrics={"mean": "result.accuracy"})
+        [{"lr": 0.1, "mean": 0.93}, {"lr": 0.01, "mean": 0.95}]
+
+        Metrics are `{name: (function, path)}` or `{function: path}`, where
+        function is one of count, sum, mean, min, max and path starts with
+        "config" or "result". The order of groups is not defined.
+
+        When the computation stores JSON of inputs and results (json_inputs and
+        json_result), the aggregation is computed by the database,
+        otherwise entries are streamed and reduced in Python.
+        """
+        return get_current_store().aggregate(self, group_by, metrics)
+
+    def to_frame(
+        self,
+        fields: Sequence[str] | None = None,
+        replicas: bool = True,
+        chunk_size: int = 1000,
+    ):
+        """
+        Returns finished entries as a pandas DataFrame.
+
+        `fields` is a subset of "config", "replica", "result", "start_date",
+        "finish_date", "run_info" (default: config, replica, result).
+        Config is flattened into one column per (nested) field.
+        Results are not loaded unless "result" is in `fields`.
+        When `replicas` is False, only replica 0 is returned.
+        """
+        return get_current_store().to_frame(self, fields, replicas, chunk_size)
+
     def keys(self) -> list[Key]:
         return get_current_store().query_keys(self)
 
@@ -129,9 +344,32 @@ def computation(
     version: int = 0,
     json_inputs: bool = False,
     json_result: bool = False,
+    key_memo_size: int = 0,
+    dedup_result: bool = False,
 ):
+    """
+    Turns a function into a Computation.
+
+    When `key_memo_size` is positive, keys of calls whose arguments are all
+    basic values (str, int, float, bool, None) are memoized, up to the given
+    number of different calls.
+
+    When `dedup_result` is True, results are stored by the hash of their
+    serialized form, so identical results of different calls are stored once.
+    Loaded results may then be shared by several entries and should not be
+    modified.
+    """
+
     def _helper(fn):
-        return Computation(fn, name, version, json_inputs, json_result)
+        return Computation(
+            fn,
+            name,
+            version,
+            json_inputs,
+            json_result,
+            key_memo_size=key_memo_size,
+            dedup_result=dedup_result,
+        )
 
     if fn is not None:
         return _helper(fn)
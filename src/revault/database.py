@@ -1,12 +1,22 @@
-from typing import Any, Callable, Tuple
+import contextlib
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Sequence, Tuple
 
 import sqlalchemy as sa
 from sqlalchemy.sql.expression import func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.dialects.postgresql import JSONB
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from .aggregate import Metric
+from .backend import Backend
+from .blobs import Blob, BlobCache
 from .key import Key
-from .entry import AnnounceResult, EntryId, Entry
+from .migrations import SCHEMA_VERSION, migrate
+from .entry import AnnounceResult, EntryId, Entry, TaskId
 
 
 # def _set_sqlite_pragma(dbapi_connection, _connection_record):
@@ -17,10 +27,78 @@ from .entry import AnnounceResult, EntryId, Entry
 # Use JSON with SQLite and JSONB with PostgreSQL.
 JsonVariant = sa.JSON().with_variant(JSONB(), "postgresql")
 
+# Dialects supporting INSERT ... ON CONFLICT DO NOTHING
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
 
-class Database:
+# Engines (and their connection pools) are shared by all Databases with the same URL
+# and the schema is checked only once per URL within a process.
+_ENGINES: dict[str, sa.Engine] = {}
+_INITIALIZED_URLS: set[str] = set()
+_ENGINES_LOCK = threading.Lock()
+
+
+# Key of the PostgreSQL advisory lock held while the schema is created or migrated
+_SCHEMA_LOCK_ID = 0x7265766175  # "revau"
+
+# Maximal number of values in a single IN (...) clause
+_IN_CHUNK_SIZE = 500
+
+
+def _unpickle(data: bytes | None) -> Any:
+    return None if data is None else pickle.loads(data)
+
+
+def _is_private_url(url: str) -> bool:
+    # Each connection to in-memory SQLite is a new database, so it cannot be shared
+    url = sa.engine.make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def _get_engine(url: str) -> sa.Engine:
+    if _is_private_url(url):
+        return sa.create_engine(url)
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(url)
+        if engine is None:
+            engine = sa.create_engine(url)
+            _ENGINES[url] = engine
+        return engine
+
+
+def dispose_engines():
+    """
+    Closes all cached engines and forgets schema checks.
+
+    Call it after forking a process or when a database was removed or recreated
+    behind revault's back.
+    """
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
+        _INITIALIZED_URLS.clear()
+
+
+class _Explain(sa.Executable, sa.ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement: sa.Executable, prefix: str):
+        self.statement = statement
+        self.prefix = prefix
+
+
+@compiles(_Explain)
+def _compile_explain(element, compiler, **kw):
+    return f"{element.prefix} {compiler.process(element.statement, **kw)}"
+
+
+class Database(Backend):
     def __init__(self, url):
-        engine = sa.create_engine(url)
+        engine = _get_engine(url)
         # if "sqlite" in engine.dialect.name:
         #     sa.event.listen(engine, "connect", _set_sqlite_pragma)
         self.url = url
@@ -48,31 +126,198 @@ class Database:
                 nullable=True,
             ),
             sa.Column("run_info", sa.JSON),
+            sa.Column("result_digest", sa.String(64), nullable=True),
+            sa.UniqueConstraint("name", "version", "config_key", "replica"),
+        )
+        c = self.entries.c
+        # Used by cancel_running and other lookups of unfinished entries
+        sa.Index(
+            "ix_entries_unfinished",
+            c.id,
+            sqlite_where=c.finish_date == None,
+            postgresql_where=c.finish_date == None,
+        )
+        sa.Index("ix_entries_name_version_finish", c.name, c.version, c.finish_date)
+        # A single row with id=1
+        self.schema_info = sa.Table(
+            "schema_info",
+            metadata,
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=False),
+            sa.Column("version", sa.Integer, nullable=False),
+        )
+        self.blobs = sa.Table(
+            "blobs",
+            metadata,
+            sa.Column("digest", sa.String(64), primary_key=True),  # sha256 hexdigest
+            sa.Column("data", sa.LargeBinary),
+            sa.Column("refcount", sa.Integer),
+        )
+        self.tasks = sa.Table(
+            "tasks",
+            metadata,
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("name", sa.String(80)),
+            sa.Column("version", sa.Integer),
+            sa.Column("config_key", sa.String(56)),
+            sa.Column("replica", sa.Integer),
+            sa.Column("config", sa.PickleType),
+            sa.Column(
+                "claim_date",
+                sa.DateTime(timezone=True),
+                nullable=True,
+                index=True,
+            ),
+            sa.Column("worker", sa.String(80), nullable=True),
+            sa.Column("error", sa.Text, nullable=True),
+            sa.UniqueConstraint("name", "version", "config_key", "replica"),
+        )
+
+        self.checkpoints = sa.Table(
+            "checkpoints",
+            metadata,
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("name", sa.String(80)),
+            sa.Column("version", sa.Integer),
+            sa.Column("config_key", sa.String(56)),
+            sa.Column("replica", sa.Integer),
+            sa.Column("data", sa.LargeBinary),
+            sa.Column("date", sa.DateTime(timezone=True)),
             sa.UniqueConstraint("name", "version", "config_key", "replica"),
         )
 
         self.metadata = metadata
         self.engine = engine
+        self.blob_cache = BlobCache()
+
+    def _select_with_result(self, *columns):
+        """Select of columns followed by result, result_digest and blob data"""
+        c = self.entries.c
+        b = self.blobs.c
+        return sa.select(*columns, c.result, c.result_digest, b.data).select_from(
+            self.entries.outerjoin(self.blobs, b.digest == c.result_digest)
+        )
+
+    def _result(self, result: Any, digest: str | None, data: bytes | None) -> Any:
+        if digest is None:
+            return result
+        return self.blob_cache.load(digest, data)
+
+    def _release_blobs(self, conn, add_filter: Callable):
+        """Decrements refcounts of blobs used by entries selected by add_filter"""
+        c = self.entries.c
+        b = self.blobs.c
+        select = add_filter(
+            sa.select(c.result_digest, func.count())
+            .where(c.result_digest != None)
+            .group_by(c.result_digest)
+        )
+        digests = conn.execute(select).all()
+        for digest, count in digests:
+            conn.execute(
+                sa.update(self.blobs)
+                .where(b.digest == digest)
+                .values(refcount=b.refcount - count)
+            )
+        if digests:
+            conn.execute(
+                sa.delete(self.blobs)
+                .where(b.digest.in_([d for d, _ in digests]))
+                .where(b.refcount <= 0)
+            )
+
+    def _store_blob(self, conn, blob: Blob):
+        digest, data = blob
+        b = self.blobs.c
+        increment = (
+            sa.update(self.blobs)
+            .where(b.digest == digest)
+            .values(refcount=b.refcount + 1)
+        )
+        if conn.execute(increment).rowcount > 0:
+            return
+        dialect = conn.dialect.name
+        insert = _INSERTS.get(dialect, sa.insert)(self.blobs).values(
+            digest=digest, data=data, refcount=1
+        )
+        if dialect in _INSERTS:
+            insert = insert.on_conflict_do_nothing()
+        if conn.execute(insert).rowcount == 0:
+            # Inserted concurrently by someone else
+            conn.execute(increment)
 
     def load_replica_entries(self, key: Key) -> list[Entry]:
         c = self.entries.c
         with self.engine.connect() as conn:
             select = (
-                sa.select(c.id, c.result)
+                self._select_with_result(c.id)
                 .where(c.name == key.name)
                 .where(c.version == key.version)
                 .where(c.config_key == key.config_key)
                 .where(c.finish_date != None)
             )
             return [
-                Entry(entry_id=r[0], key=key, result=r[1]) for r in conn.execute(select)
+                Entry(entry_id=r[0], key=key, result=self._result(r[1], r[2], r[3]))
+                for r in conn.execute(select)
             ]
 
+    def load_replicas_many(
+        self, keys: Sequence[Key], threads: int = 1
+    ) -> dict[Key, list[Any]]:
+        c = self.entries.c
+        keys = list(dict.fromkeys(keys))
+        groups: dict[tuple[str, int], dict[str, list[Key]]] = {}
+        for key in keys:
+            group = groups.setdefault((key.name, key.version), {})
+            group.setdefault(key.config_key, []).append(key)
+
+        # Results are fetched as raw bytes and unpickled afterwards,
+        # so that the (possibly large) payloads can be deserialized in threads
+        b = self.blobs.c
+        raw_result = sa.type_coerce(c.result, sa.LargeBinary)
+        rows = []
+        with self.engine.connect() as conn:
+            for (name, version), by_config in groups.items():
+                config_keys = list(by_config)
+                for i in range(0, len(config_keys), _IN_CHUNK_SIZE):
+                    select = (
+                        sa.select(c.config_key, raw_result, c.result_digest, b.data)
+                        .select_from(
+                            self.entries.outerjoin(
+                                self.blobs, b.digest == c.result_digest
+                            )
+                        )
+                        .where(c.name == name)
+                        .where(c.version == version)
+                        .where(c.config_key.in_(config_keys[i : i + _IN_CHUNK_SIZE]))
+                        .where(c.finish_date != None)
+                        .order_by(c.config_key, c.replica)
+                    )
+                    rows.extend(
+                        (by_config[r[0]], r[1], r[2], r[3])
+                        for r in conn.execute(select)
+                    )
+
+        raw = [r[1] for r in rows if r[2] is None]
+        if threads > 1 and len(raw) > 1:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                loaded = iter(list(executor.map(_unpickle, raw)))
+        else:
+            loaded = map(_unpickle, raw)
+
+        output = {key: [] for key in keys}
+        for keys_, _, digest, data in rows:
+            result = (
+                next(loaded) if digest is None else self.blob_cache.load(digest, data)
+            )
+            for key in keys_:
+                output[key].append(result)
+        return output
+
     def load_entry(self, key: Key) -> Entry | None:
         c = self.entries.c
         with self.engine.connect() as conn:
             select = (
-                sa.select(c.id, c.result)
+                self._select_with_result(c.id)
                 .where(c.name == key.name)
                 .where(c.version == key.version)
                 .where(c.config_key == key.config_key)
@@ -81,7 +326,9 @@ class Database:
             )
             r = conn.execute(select).one_or_none()
             if r is not None:
-                return Entry(entry_id=r[0], key=key, result=r[1])
+                return Entry(
+                    entry_id=r[0], key=key, result=self._result(r[1], r[2], r[3])
+                )
             else:
                 return None
 
@@ -109,6 +356,30 @@ class Database:
                 for name, version, config, config_key, replica in conn.execute(select)
             ]
 
+    def has_entry(self, key: Key) -> bool:
+        c = self.entries.c
+        with self.engine.connect() as conn:
+            select = (
+                sa.select(c.id)
+                .where(c.name == key.name)
+                .where(c.version == key.version)
+                .where(c.config_key == key.config_key)
+                .where(c.replica == key.replica)
+                .where(c.finish_date != None)
+            )
+            return conn.execute(select).first() is not None
+
+    def load_key_tuples(self, names: list[str] | None) -> Iterator[tuple]:
+        c = self.entries.c
+        select = sa.select(c.name, c.config_key, c.version, c.replica).where(
+            c.finish_date != None
+        )
+        if names is not None:
+            select = select.where(c.name.in_(names))
+        with self.engine.connect() as conn:
+            for row in conn.execution_options(yield_per=10000).execute(select):
+                yield tuple(row)
+
     def load_all_keys(self) -> list[Key]:
         return self._load_keys(lambda s: s)
 
@@ -118,21 +389,170 @@ class Database:
             lambda s: s.where(c.name == name).where(c.version == version)
         )
 
-    def get_or_announce_entry(self, key: Key) -> Tuple[AnnounceResult, EntryId, Any]:
+    def iter_entries(self, name: str, version: int) -> Iterator[Tuple[dict, Any]]:
+        c = self.entries.c
+        select = (
+            self._select_with_result(c.config)
+            .where(c.name == name)
+            .where(c.version == version)
+            .where(c.finish_date != None)
+        )
+        with self.engine.connect() as conn:
+            for config, result, digest, data in conn.execution_options(
+                yield_per=1000
+            ).execute(select):
+                yield config, self._result(result, digest, data)
+
+    def iter_entry_chunks(
+        self,
+        name: str,
+        version: int,
+        fields: Sequence[str],
+        replica: int | None,
+        chunk_size: int,
+    ) -> Iterator[Sequence[tuple]]:
+        c = self.entries.c
+        select = (
+            sa.select(*[c[field] for field in fields])
+            .where(c.name == name)
+            .where(c.version == version)
+            .where(c.finish_date != None)
+        )
+        if replica is not None:
+            select = select.where(c.replica == replica)
+        if "result" not in fields:
+            with self.engine.connect() as conn:
+                result = conn.execution_options(yield_per=chunk_size).execute(select)
+                yield from result.partitions()
+            return
+
+        i = fields.index("result")
+        b = self.blobs.c
+        select = select.add_columns(c.result_digest, b.data).select_from(
+            self.entries.outerjoin(self.blobs, b.digest == c.result_digest)
+        )
+        with self.engine.connect() as conn:
+            result = conn.execution_options(yield_per=chunk_size).execute(select)
+            for chunk in result.partitions():
+                yield [
+                    tuple(row[:-2])
+                    if row[-2] is None
+                    else (
+                        *row[:i],
+                        self._result(None, row[-2], row[-1]),
+                        *row[i + 1 : -2],
+                    )
+                    for row in chunk
+                ]
+
+    def aggregate(
+        self,
+        name: str,
+        version: int,
+        group_by: list[str],
+        metrics: list[Metric],
+        json_config: bool,
+        json_result: bool,
+    ) -> list[dict]:
+        sources = {m.source for m in metrics}
+        if group_by:
+            sources.add("config")
+        if ("config" in sources and not json_config) or (
+            "result" in sources and not json_result
+        ):
+            return super().aggregate(
+                name, version, group_by, metrics, json_config, json_result
+            )
+
+        c = self.entries.c
+        if self._has_missing_json(name, version, sources):
+            # Some values could not be stored as JSON (or were stored
+            # before JSON columns were filled)
+            return super().aggregate(
+                name, version, group_by, metrics, json_config, json_result
+            )
+
+        columns = {"config": c.config_json, "result": c.result_json}
+        groups = [c.config_json[field] for field in group_by]
+        exprs = []
+        for metric in metrics:
+            if metric.source is None:
+                exprs.append(func.count())
+                continue
+            column = columns[metric.source]
+            if metric.function == "count":
+                value = column[metric.path].as_string() if metric.path else column
+                exprs.append(func.count(value))
+                continue
+            if metric.path:
+                value = column[metric.path].as_float()
+            else:
+                value = sa.cast(column, sa.Float)
+            fn = (
+                func.avg
+                if metric.function == "mean"
+                else getattr(func, metric.function)
+            )
+            exprs.append(fn(value))
+
+        select = (
+            sa.select(*groups, *exprs)
+            .where(c.name == name)
+            .where(c.version == version)
+            .where(c.finish_date != None)
+            .group_by(*groups)
+        )
+        names = group_by + [m.name for m in metrics]
+        with self.engine.connect() as conn:
+            return [dict(zip(names, row)) for row in conn.execute(select)]
+
+    def _has_missing_json(self, name: str, version: int, sources: set) -> bool:
+        c = self.entries.c
+        missing = []
+        if "config" in sources:
+            missing.append(c.config_json == None)
+        if "result" in sources:
+            missing.append(
+                sa.and_(
+                    c.result_json == None,
+                    sa.or_(c.result != None, c.result_digest != None),
+                )
+            )
+        if not missing:
+            return False
+        select = (
+            sa.select(c.id)
+            .where(c.name == name)
+            .where(c.version == version)
+            .where(c.finish_date != None)
+            .where(sa.or_(*missing))
+            .limit(1)
+        )
+        with self.engine.connect() as conn:
+            return conn.execute(select).first() is not None
+
+    def get_or_announce_entry(
+        self, key: Key, expect_missing: bool = False
+    ) -> Tuple[AnnounceResult, EntryId, Any]:
         c = self.entries.c
         with self.engine.connect() as conn:
             select = (
-                sa.select(c.id, c.result, c.finish_date)
+                self._select_with_result(c.id, c.finish_date)
                 .where(c.name == key.name)
                 .where(c.version == key.version)
                 .where(c.config_key == key.config_key)
                 .where(c.replica == key.replica)
             )
-            r = conn.execute(select).one_or_none()
-            if r is not None:
-                if r[2] is None:
-                    return AnnounceResult.COMPUTING_ELSEWHERE, r[0], None
-                return AnnounceResult.FINISHED, r[0], r[1]
+            if not expect_missing:
+                r = conn.execute(select).one_or_none()
+                if r is not None:
+                    if r[1] is None:
+                        return AnnounceResult.COMPUTING_ELSEWHERE, r[0], None
+                    return (
+                        AnnounceResult.FINISHED,
+                        r[0],
+                        self._result(r[2], r[3], r[4]),
+                    )
             try:
                 stmt = (
                     sa.insert(self.entries)
@@ -148,34 +568,46 @@ class Database:
                 conn.commit()
                 return AnnounceResult.COMPUTE_HERE, r[0], None
             except sa.exc.IntegrityError:
-                select = (
-                    sa.select(c.id, c.result, c.finish_date)
-                    .where(c.name == key.name)
-                    .where(c.version == key.version)
-                    .where(c.config_key == key.config_key)
-                    .where(c.replica == key.replica)
-                )
+                conn.rollback()
                 r = conn.execute(select).one()
-                if r[2] is None:
+                if r[1] is None:
                     return AnnounceResult.COMPUTING_ELSEWHERE, r[0], None
                 else:
-                    return AnnounceResult.FINISHED, r[0], r[1]
+                    return AnnounceResult.FINISHED, r[0], self._result(r[2], r[3], r[4])
 
     def finish_entry(
-        self, entry_id: EntryId, result: Any, run_info: dict, config: dict
+        self,
+        entry_id: EntryId,
+        result: Any,
+        run_info: dict,
+        config: dict,
+        config_json: Any = None,
+        result_json: Any = None,
+        blob: Blob | None = None,
     ):
+        values = {
+            "result": result,
+            "run_info": run_info,
+            "config": config,
+            "finish_date": datetime.now(),
+        }
+        # Passing None would store JSON 'null', keep SQL NULL for non-JSON entries
+        if config_json is not None:
+            values["config_json"] = config_json
+        if result_json is not None:
+            values["result_json"] = result_json
+        if blob is not None:
+            values["result"] = None
+            values["result_digest"] = blob[0]
         with self.engine.connect() as conn:
             stmt = (
                 sa.update(self.entries)
                 .where(self.entries.c.id == entry_id)
-                .values(
-                    result=result,
-                    run_info=run_info,
-                    config=config,
-                    finish_date=datetime.now(),
-                )
+                .values(**values)
             )
-            conn.execute(stmt)
+            # The entry may have been removed meanwhile, the blob is then not used
+            if conn.execute(stmt).rowcount == 1 and blob is not None:
+                self._store_blob(conn, blob)
             conn.commit()
 
     def cancel_entry(self, entry_id):
@@ -186,16 +618,110 @@ class Database:
 
     def remove(self, key: Key):
         c = self.entries.c
-        with self.engine.connect() as conn:
-            stmt = (
-                sa.delete(self.entries)
-                .where(c.name == key.name)
+
+        def add_filter(stmt):
+            return (
+                stmt.where(c.name == key.name)
                 .where(c.version == key.version)
                 .where(c.config_key == key.config_key)
                 .where(c.replica == key.replica)
             )
-            conn.execute(stmt)
+
+        with self.engine.connect() as conn:
+            self._release_blobs(conn, add_filter)
+            conn.execute(add_filter(sa.delete(self.entries)))
+            conn.commit()
+
+    def remove_where(
+        self,
+        name: str | None,
+        version: int | None,
+        version_lt: int | None,
+        finished_before: datetime | None,
+    ) -> int:
+        def add_filter(stmt, c):
+            if name is not None:
+                stmt = stmt.where(c.name == name)
+            if version is not None:
+                stmt = stmt.where(c.version == version)
+            if version_lt is not None:
+                stmt = stmt.where(c.version < version_lt)
+            return stmt
+
+        def add_entries_filter(stmt):
+            c = self.entries.c
+            # Unfinished entries are being computed (see cancel_running)
+            stmt = add_filter(stmt, c).where(c.finish_date != None)
+            if finished_before is not None:
+                stmt = stmt.where(c.finish_date < finished_before)
+            return stmt
+
+        with self.engine.connect() as conn:
+            self._release_blobs(conn, add_entries_filter)
+            count = conn.execute(add_entries_filter(sa.delete(self.entries))).rowcount
+            if finished_before is None:
+                conn.execute(
+                    add_filter(sa.delete(self.checkpoints), self.checkpoints.c)
+                )
             conn.commit()
+        return count
+
+    def list_versions(self, name: str) -> list[int]:
+        c = self.entries.c
+        with self.engine.connect() as conn:
+            select = (
+                sa.select(c.version)
+                .where(c.name == name)
+                .distinct()
+                .order_by(c.version)
+            )
+            return list(conn.execute(select).scalars())
+
+    def compact(self, full: bool = False) -> int:
+        dialect = self.engine.dialect.name
+        if dialect == "sqlite":
+            size = sa.text(
+                "SELECT page_count * page_size "
+                "FROM pragma_page_count(), pragma_page_size()"
+            )
+            commands = ["VACUUM"]
+            after_commands = ["ANALYZE"]
+        elif dialect == "postgresql":
+            size = sa.text("SELECT pg_database_size(current_database())")
+            # VACUUM FULL returns space to the OS, but locks the tables
+            commands = ["VACUUM (FULL, ANALYZE)" if full else "VACUUM (ANALYZE)"]
+            after_commands = []
+        else:
+            raise Exception(f"Compaction is not supported for {dialect}")
+        with self.engine.connect() as conn:
+            # VACUUM cannot run inside a transaction
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            before = conn.execute(size).scalar()
+            for command in commands:
+                conn.execute(sa.text(command))
+            after = conn.execute(size).scalar()
+            # Statistics are not counted, they may take a few pages
+            for command in after_commands:
+                conn.execute(sa.text(command))
+        return max(before - after, 0)
+
+    def schema_version(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                sa.select(self.schema_info.c.version).where(self.schema_info.c.id == 1)
+            ).scalar_one()
+
+    def explain(self, query: sa.Executable | str) -> list[str]:
+        if isinstance(query, str):
+            query = sa.text(query)
+        dialect = self.engine.dialect.name
+        with self.engine.connect() as conn:
+            if dialect == "sqlite":
+                rows = conn.execute(_Explain(query, "EXPLAIN QUERY PLAN"))
+                return [row[-1] for row in rows]
+            elif dialect == "postgresql":
+                return [row[0] for row in conn.execute(_Explain(query, "EXPLAIN"))]
+        raise Exception(f"Explain is not supported for {dialect}")
 
     def insert_new_replica(self, key: Key, result: Any) -> int:
         c = self.entries.c
@@ -224,5 +750,205 @@ class Database:
             conn.commit()
             return replica
 
+    def _checkpoint_filter(self, stmt, key: Key):
+        c = self.checkpoints.c
+        return (
+            stmt.where(c.name == key.name)
+            .where(c.version == key.version)
+            .where(c.config_key == key.config_key)
+            .where(c.replica == key.replica)
+        )
+
+    def save_checkpoint(self, key: Key, data: bytes):
+        with self.engine.connect() as conn:
+            stmt = self._checkpoint_filter(sa.update(self.checkpoints), key).values(
+                data=data, date=datetime.now()
+            )
+            if conn.execute(stmt).rowcount == 0:
+                stmt = sa.insert(self.checkpoints).values(
+                    name=key.name,
+                    version=key.version,
+                    config_key=key.config_key,
+                    replica=key.replica,
+                    data=data,
+                    date=datetime.now(),
+                )
+                conn.execute(stmt)
+            conn.commit()
+
+    def load_checkpoint(self, key: Key) -> bytes | None:
+        with self.engine.connect() as conn:
+            select = self._checkpoint_filter(sa.select(self.checkpoints.c.data), key)
+            r = conn.execute(select).one_or_none()
+            return r[0] if r is not None else None
+
+    def remove_checkpoint(self, key: Key):
+        with self.engine.connect() as conn:
+            conn.execute(self._checkpoint_filter(sa.delete(self.checkpoints), key))
+            conn.commit()
+
+    def enqueue(self, keys: list[Key]) -> int:
+        count = 0
+        with self.engine.connect() as conn:
+            for key in keys:
+                stmt = sa.insert(self.tasks).values(
+                    name=key.name,
+                    version=key.version,
+                    config_key=key.config_key,
+                    replica=key.replica,
+                    config=key.config,
+                )
+                try:
+                    conn.execute(stmt)
+                    conn.commit()
+                    count += 1
+                except sa.exc.IntegrityError:
+                    conn.rollback()
+        return count
+
+    def claim_task(
+        self, worker: str, lease: float | None = None
+    ) -> Tuple[TaskId, Key] | None:
+        c = self.tasks.c
+        now = datetime.now()
+        claimable = c.claim_date == None
+        if lease is not None:
+            expired = sa.and_(
+                c.error == None, c.claim_date < now - timedelta(seconds=lease)
+            )
+            claimable = sa.or_(claimable, expired)
+        # FOR UPDATE SKIP LOCKED lets concurrent PostgreSQL workers pass over rows
+        # that are being claimed by someone else; SQLite ignores the clause,
+        # but the write transaction serializes claims.
+        candidate = (
+            sa.select(c.id, c.claim_date)
+            .where(claimable)
+            .order_by(c.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        with self._write_transaction() as conn:
+            r = conn.execute(candidate).one_or_none()
+            if r is None:
+                return None
+            task_id, previous_claim = r
+            stmt = (
+                sa.update(self.tasks)
+                .where(c.id == task_id)
+                .values(claim_date=now, worker=worker)
+                .returning(c.name, c.version, c.config, c.config_key, c.replica)
+            )
+            name, version, config, config_key, replica = conn.execute(stmt).one()
+            if previous_claim is not None:
+                # The lease expired, the previous worker is considered dead
+                e = self.entries.c
+                conn.execute(
+                    sa.delete(self.entries)
+                    .where(e.name == name)
+                    .where(e.version == version)
+                    .where(e.config_key == config_key)
+                    .where(e.replica == replica)
+                    .where(e.finish_date == None)
+                )
+        return task_id, Key(name, version, config, replica, config_key=config_key)
+
+    def renew_task(self, task_id: TaskId):
+        with self.engine.connect() as conn:
+            stmt = (
+                sa.update(self.tasks)
+                .where(self.tasks.c.id == task_id)
+                .values(claim_date=datetime.now())
+            )
+            conn.execute(stmt)
+            conn.commit()
+
+    def requeue_failed_tasks(self, name: str | None) -> int:
+        c = self.tasks.c
+        stmt = (
+            sa.update(self.tasks)
+            .where(c.error != None)
+            .values(claim_date=None, worker=None, error=None)
+        )
+        if name is not None:
+            stmt = stmt.where(c.name == name)
+        with self.engine.connect() as conn:
+            count = conn.execute(stmt).rowcount
+            conn.commit()
+        return count
+
+    def finish_task(self, task_id: TaskId):
+        with self.engine.connect() as conn:
+            stmt = sa.delete(self.tasks).where(self.tasks.c.id == task_id)
+            conn.execute(stmt)
+            conn.commit()
+
+    def fail_task(self, task_id: TaskId, error: str):
+        with self.engine.connect() as conn:
+            stmt = (
+                sa.update(self.tasks)
+                .where(self.tasks.c.id == task_id)
+                .values(error=error)
+            )
+            conn.execute(stmt)
+            conn.commit()
+
+    @contextlib.contextmanager
+    def _write_transaction(self) -> Iterator[sa.Connection]:
+        """
+        Transaction that reads and then writes. On SQLite, the default (deferred)
+        transaction takes the write lock only at the first write and may fail to
+        get it, so the transaction is begun manually as IMMEDIATE.
+        """
+        if self.engine.dialect.name != "sqlite":
+            with self.engine.begin() as conn:
+                yield conn
+            return
+        with self.engine.connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            conn.exec_driver_sql("COMMIT")
+
+    @contextlib.contextmanager
+    def _schema_lock(self) -> Iterator[sa.Connection]:
+        """
+        Transaction that is not run concurrently with the same transaction
+        of other processes, so the schema is created and migrated only once
+        """
+        with self._write_transaction() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(sa.select(func.pg_advisory_xact_lock(_SCHEMA_LOCK_ID)))
+            yield conn
+
     def init(self):
-        self.metadata.create_all(self.engine)
+        if self.url in _INITIALIZED_URLS:
+            return
+        with self._schema_lock() as conn:
+            is_new = not sa.inspect(conn).has_table("entries")
+            self.metadata.create_all(conn)
+            # Vaults created before versioning have version 0
+            dialect = conn.dialect.name
+            insert = _INSERTS.get(dialect, sa.insert)(self.schema_info).values(
+                id=1, version=SCHEMA_VERSION if is_new else 0
+            )
+            if dialect in _INSERTS:
+                conn.execute(insert.on_conflict_do_nothing())
+            elif conn.execute(sa.select(self.schema_info.c.id)).first() is None:
+                conn.execute(insert)
+            version = conn.execute(
+                sa.select(self.schema_info.c.version).where(self.schema_info.c.id == 1)
+            ).scalar_one()
+            if version != SCHEMA_VERSION:
+                version = migrate(self, conn, version)
+                conn.execute(
+                    sa.update(self.schema_info)
+                    .where(self.schema_info.c.id == 1)
+                    .values(version=version)
+                )
+        if not _is_private_url(self.url):
+            with _ENGINES_LOCK:
+                _INITIALIZED_URLS.add(self.url)
@@ -5,6 +5,7 @@ from .key import Key
 
 
 EntryId = int
+TaskId = int
 
 
 class AnnounceResult(enum.Enum):
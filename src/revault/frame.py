@@ -0,0 +1,95 @@
+from datetime import datetime
+from typing import Any, Iterable, Sequence
+
+ENTRY_FIELDS = ("replica", "config", "result", "start_date", "finish_date", "run_info")
+
+
+def _flatten(obj: dict, prefix: str, out: dict):
+    for name, value in obj.items():
+        if isinstance(value, dict) and value:
+            _flatten(value, f"{prefix}{name}.", out)
+        else:
+            out[f"{prefix}{name}"] = value
+
+
+def _flatten_configs(configs: Sequence[dict]) -> dict[str, list]:
+    columns: dict[str, list] = {}
+    for i, config in enumerate(configs):
+        flat = {}
+        _flatten(config, "", flat)
+        for name, value in flat.items():
+            column = columns.get(name)
+            if column is None:
+                column = [None] * i
+                columns[name] = column
+            column.append(value)
+        for column in columns.values():
+            if len(column) <= i:
+                column.append(None)
+    return columns
+
+
+def _object_array(np, values: Sequence[Any]):
+    # np.array() would turn a list of lists into a 2D array
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _column_array(np, values: Sequence[Any]):
+    types = set(map(type, values))
+    if types == {int}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            return _object_array(np, values)
+    if types and types <= {int, float}:
+        return np.array(values, dtype=np.float64)
+    if types == {bool}:
+        return np.array(values, dtype=np.bool_)
+    if types == {datetime} and all(v.tzinfo is None for v in values):
+        return np.array(values, dtype="datetime64[us]")
+    return _object_array(np, values)
+
+
+def build_frame(chunks: Iterable[Sequence[tuple]], fields: Sequence[str]):
+    """
+    Builds a DataFrame from chunks of rows with values of `fields`.
+    Each chunk is converted into typed NumPy arrays, that are concatenated
+    at the end, so no per-row Python objects are kept.
+    """
+    try:
+        import numpy as np
+        import pandas as pd
+    except ImportError as e:
+        raise ImportError("to_frame() requires numpy and pandas") from e
+
+    arrays: dict[str, list] = {}
+    length = 0
+    for chunk in chunks:
+        size = len(chunk)
+        chunk_columns = {}
+        for name, values in zip(fields, zip(*chunk)):
+            if name == "config":
+                chunk_columns.update(_flatten_configs(values))
+            else:
+                chunk_columns[name] = values
+        for name, values in chunk_columns.items():
+            column = arrays.get(name)
+            if column is None:
+                column = [_object_array(np, [None] * length)] if length else []
+                arrays[name] = column
+            column.append(_column_array(np, values))
+        for name, column in arrays.items():
+            if name not in chunk_columns:
+                column.append(_object_array(np, [None] * size))
+        length += size
+    if not length:
+        return pd.DataFrame({name: [] for name in fields if name != "config"})
+    return pd.DataFrame(
+        {
+            name: column[0] if len(column) == 1 else np.concatenate(column)
+            for name, column in arrays.items()
+        }
+    )
@@ -0,0 +1,251 @@
+import bisect
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable
+
+from .key import Key
+
+if TYPE_CHECKING:
+    from .store import RunningTask
+
+
+class StoreHook:
+    """
+    Base class for hooks registered by `Store.add_hook`.
+
+    All methods do nothing by default, subclasses override what they need.
+    Hooks are called synchronously (some of them while Store's lock is held),
+    so they should be cheap. Durations are in seconds.
+    """
+
+    def on_hit(self, key: Key):
+        """Result was found in the database"""
+
+    def on_miss(self, key: Key):
+        """Result was not found and it is going to be computed"""
+
+    def on_wait(self, key: Key, duration: float):
+        """Result was computed by another thread and this thread waited for it"""
+
+    def on_compute_start(self, task: "RunningTask"):
+        pass
+
+    def on_compute_end(
+        self, task: "RunningTask", duration: float, error: BaseException | None
+    ):
+        pass
+
+    def on_db_query(self, operation: str, duration: float, task: "RunningTask | None"):
+        """
+        Backend method `operation` was called. It includes (de)serialization
+        of configs and results. `task` is the computation running in the
+        calling context, if any.
+        """
+
+
+class Histogram:
+    """Histogram of durations with exponential buckets (10us .. ~20min)"""
+
+    BOUNDS = tuple(1e-5 * 2**i for i in range(27))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket that contains the q-quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for i, count in enumerate(self.counts):
+            total += count
+            if total >= rank and count:
+                return self.BOUNDS[i] if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class StatsCollector(StoreHook):
+    """
+    Counts events and collects histograms of durations.
+
+    >>> stats = StatsCollector()
+    >>> store.add_hook(stats)
+    >>> ...
+    >>> stats.counters["hit"], stats.histograms["compute"].summary()
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Counter[str] = Counter()
+        self.histograms: dict[str, Histogram] = {}
+
+    def _add(self, name: str, duration: float | None = None):
+        with self.lock:
+            self.counters[name] += 1
+            if duration is not None:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = Histogram()
+                    self.histograms[name] = histogram
+                histogram.add(duration)
+
+    def on_hit(self, key: Key):
+        self._add("hit")
+
+    def on_miss(self, key: Key):
+        self._add("miss")
+
+    def on_wait(self, key: Key, duration: float):
+        self._add("wait", duration)
+
+    def on_compute_end(
+        self, task: "RunningTask", duration: float, error: BaseException | None
+    ):
+        self._add("compute", duration)
+        if error is not None:
+            self._add("error")
+
+    def on_db_query(self, operation: str, duration: float, task: "RunningTask | None"):
+        self._add("db." + operation, duration)
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: h.summary() for name, h in self.histograms.items()
+                },
+            }
+
+
+def _new_id(bits: int) -> str:
+    return os.urandom(bits // 8).hex()
+
+
+@dataclass
+class Span:
+    """Finished span in the shape of OpenTelemetry spans (times in ns)"""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None
+    start_time: int
+    end_time: int
+    attributes: dict[str, Any] = field(default_factory=dict)
+    status: str = "OK"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "startTimeUnixNano": self.start_time,
+            "endTimeUnixNano": self.end_time,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class SpanRecorder(StoreHook):
+    """
+    Records computations and database queries as spans.
+
+    A computation called from another computation is a child span of the
+    caller; database queries are children of the computation that issued them.
+    Finished spans are stored in `spans`, and passed to `export`
+    (e.g. a function sending them to an OpenTelemetry collector) if given.
+    """
+
+    def __init__(self, export: Callable[[Span], None] | None = None):
+        self.lock = threading.Lock()
+        self.export = export
+        self.spans: list[Span] = []
+        # id(RunningTask) -> (trace_id, span_id, start_time)
+        self._open: dict[int, tuple[str, str, int]] = {}
+
+    def _finish(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+        if self.export is not None:
+            self.export(span)
+
+    def _parent(self, task: "RunningTask | None") -> tuple[str, str | None]:
+        if task is not None:
+            parent = self._open.get(id(task))
+            if parent is not None:
+                return parent[0], parent[1]
+        return _new_id(128), None
+
+    def on_compute_start(self, task: "RunningTask"):
+        with self.lock:
+            trace_id, _ = self._parent(task.parent)
+            self._open[id(task)] = (trace_id, _new_id(64), time.time_ns())
+
+    def on_compute_end(
+        self, task: "RunningTask", duration: float, error: BaseException | None
+    ):
+        with self.lock:
+            trace_id, span_id, start_time = self._open.pop(id(task))
+            parent = self._open.get(id(task.parent)) if task.parent else None
+        key = task.key
+        self._finish(
+            Span(
+                name=f"compute {key.name}",
+                trace_id=trace_id,
+                span_id=span_id,
+                parent_span_id=parent[1] if parent else None,
+                start_time=start_time,
+                end_time=time.time_ns(),
+                attributes={
+                    "revault.name": key.name,
+                    "revault.version": key.version,
+                    "revault.replica": key.replica,
+                    "revault.config_key": key.config_key,
+                },
+                status="OK" if error is None else "ERROR",
+            )
+        )
+
+    def on_db_query(self, operation: str, duration: float, task: "RunningTask | None"):
+        end_time = time.time_ns()
+        with self.lock:
+            trace_id, parent_span_id = self._parent(task)
+        self._finish(
+            Span(
+                name=f"db {operation}",
+                trace_id=trace_id,
+                span_id=_new_id(64),
+                parent_span_id=parent_span_id,
+                start_time=end_time - int(duration * 1e9),
+                end_time=end_time,
+                attributes={"db.operation": operation},
+            )
+        )
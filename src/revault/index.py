@@ -0,0 +1,137 @@
+import hashlib
+import math
+import threading
+import time
+from typing import Callable, Iterable
+
+from .key import Key
+
+KeyTuple = tuple  # Key.tuple_key: (name, config_key, version, replica)
+
+
+class BloomFilter:
+    """Bloom filter of key tuples; it has false positives, but no false negatives"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: KeyTuple):
+        digest = hashlib.blake2b(repr(item).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: KeyTuple):
+        for p in self._positions(item):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, item: KeyTuple) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+
+class KeyIndex:
+    """
+    Local snapshot of keys of finished entries.
+
+    `contains` returns True/False when the index knows the answer,
+    and None when the key has to be checked in the database (the name is not
+    indexed, or a Bloom filter reports a possible match). The snapshot is
+    reloaded when it is older than `refresh_interval` seconds; changes made by
+    other processes may be missed until then.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[list[str] | None], Iterable[KeyTuple]],
+        names: Iterable[str] | None = None,
+        refresh_interval: float | None = 60.0,
+        bloom: bool = False,
+    ):
+        self._load = load
+        self.names = frozenset(names) if names is not None else None
+        self.refresh_interval = refresh_interval
+        self.bloom = bloom
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.keys: set[KeyTuple] | BloomFilter = set()
+        self.loaded_at = None
+        # Local changes made while a snapshot is being loaded, (add, key_tuple)
+        self._changes: list[tuple[bool, KeyTuple]] | None = None
+        self.reload()
+
+    def reload(self):
+        with self.reload_lock:
+            self._reload()
+
+    def _reload(self):
+        with self.lock:
+            self._changes = []
+        try:
+            keys = self._load(sorted(self.names) if self.names is not None else None)
+            if self.bloom:
+                keys = list(keys)
+                bloom = BloomFilter(2 * len(keys) + 1024)
+                for key in keys:
+                    bloom.add(key)
+                keys = bloom
+            else:
+                keys = set(keys)
+            with self.lock:
+                # The snapshot may have been read before these changes
+                for add, key in self._changes:
+                    if add:
+                        keys.add(key)
+                    elif not self.bloom:
+                        keys.discard(key)
+                self.keys = keys
+                self.loaded_at = time.monotonic()
+        finally:
+            with self.lock:
+                self._changes = None
+
+    def _is_stale(self) -> bool:
+        return self.loaded_at is None or (
+            self.refresh_interval is not None
+            and time.monotonic() - self.loaded_at > self.refresh_interval
+        )
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def covers(self, key: Key) -> bool:
+        return self.names is None or key.name in self.names
+
+    def contains(self, key: Key) -> bool | None:
+        if not self.covers(key):
+            return None
+        if self._is_stale():
+            with self.reload_lock:
+                # Another thread may have reloaded it meanwhile
+                if self._is_stale():
+                    self._reload()
+        with self.lock:
+            found = key.tuple_key in self.keys
+        if found and self.bloom:
+            return None
+        return found
+
+    def add(self, key: Key):
+        if self.covers(key):
+            with self.lock:
+                self.keys.add(key.tuple_key)
+                if self._changes is not None:
+                    self._changes.append((True, key.tuple_key))
+
+    def discard(self, key: Key):
+        if self.covers(key):
+            with self.lock:
+                if self._changes is not None:
+                    self._changes.append((False, key.tuple_key))
+                if self.bloom:
+                    # Items cannot be removed from a Bloom filter
+                    return
+                self.keys.discard(key.tuple_key)
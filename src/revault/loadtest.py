@@ -0,0 +1,256 @@
+"""
+Load test of concurrent access to a store.
+
+Starts several processes, each with several threads, that call a computation
+on overlapping sets of keys and reports throughput, latencies, duplicate
+computations and errors:
+
+    $ python -m revault.loadtest sqlite:///tmp/test.db --processes 4 --threads 4
+"""
+
+import argparse
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .comp import computation
+from .store import Store
+
+_COMPUTED: list[int] = []
+
+
+@computation(name="revault_loadtest")
+def _load_fn(x: int, run: str, work: float):
+    _COMPUTED.append(x)
+    if work:
+        time.sleep(work)
+    return x
+
+
+@dataclass
+class _WorkerResult:
+    latencies: list[float] = field(default_factory=list)
+    outcomes: Counter = field(default_factory=Counter)
+    computed: list[int] = field(default_factory=list)
+    duration: float = 0.0
+
+
+def _classify(error: Exception) -> str:
+    if "computed in another process" in str(error):
+        return "computing_elsewhere"
+    return type(error).__name__
+
+
+def _run_thread(store, keys, run, work, insert_ratio, rng, result):
+    for x in keys:
+        ref = _load_fn.ref(x, run, work)
+        start = time.perf_counter()
+        try:
+            if rng.random() < insert_ratio:
+                store.insert_new_replica(ref, x)
+                outcome = "inserted_replica"
+            else:
+                store.get_entry(ref)
+                outcome = "ok"
+        except Exception as e:
+            outcome = _classify(e)
+        result.latencies.append(time.perf_counter() - start)
+        result.outcomes[outcome] += 1
+
+
+def _run_process(
+    queue, barrier, url, run, index, threads, keys, calls, work, insert_ratio, seed
+):
+    try:
+        store = Store(url)
+        # Start all processes at once, after the slow part of spawning them
+        barrier.wait(timeout=120)
+        start = time.perf_counter()
+        total = _run_threads(
+            store, run, index, threads, keys, calls, work, insert_ratio, seed
+        )
+        total.duration = time.perf_counter() - start
+        queue.put(total)
+    except BaseException as e:
+        queue.put(e)
+        raise
+
+
+def _run_threads(store, run, index, threads, keys, calls, work, insert_ratio, seed):
+    results = []
+    pool = []
+    for t in range(threads):
+        rng = random.Random(seed * 1_000_003 + index * 1009 + t)
+        thread_keys = [rng.randrange(keys) for _ in range(calls)]
+        result = _WorkerResult()
+        results.append(result)
+        pool.append(
+            threading.Thread(
+                target=_run_thread,
+                args=(store, thread_keys, run, work, insert_ratio, rng, result),
+            )
+        )
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    total = _WorkerResult(computed=list(_COMPUTED))
+    for result in results:
+        total.latencies.extend(result.latencies)
+        total.outcomes.update(result.outcomes)
+    return total
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+@dataclass
+class LoadTestReport:
+    duration: float
+    calls: int
+    latencies: list[float]
+    outcomes: Counter
+    computations: int
+    duplicates: int
+
+    @property
+    def throughput(self) -> float:
+        return self.calls / self.duration if self.duration else 0.0
+
+    @property
+    def errors(self) -> int:
+        return sum(
+            count
+            for outcome, count in self.outcomes.items()
+            if outcome not in ("ok", "inserted_replica", "computing_elsewhere")
+        )
+
+    def latency(self, q: float) -> float:
+        return _percentile(self.latencies, q)
+
+    def format(self) -> str:
+        lines = [
+            f"calls:        {self.calls} in {self.duration:.2f}s "
+            f"({self.throughput:.1f} calls/s)",
+            f"latency:      p50={self.latency(0.5) * 1000:.2f}ms "
+            f"p90={self.latency(0.9) * 1000:.2f}ms "
+            f"p99={self.latency(0.99) * 1000:.2f}ms "
+            f"max={self.latency(1.0) * 1000:.2f}ms",
+            f"computations: {self.computations} (duplicates: {self.duplicates})",
+            f"errors:       {self.errors} ({self.errors / max(self.calls, 1):.2%})",
+        ]
+        for outcome, count in sorted(self.outcomes.items()):
+            lines.append(f"  {outcome}: {count}")
+        return "\n".join(lines)
+
+
+def run_loadtest(
+    url: str,
+    processes: int = 4,
+    threads: int = 4,
+    keys: int = 100,
+    calls: int = 100,
+    work: float = 0.0,
+    insert_ratio: float = 0.0,
+    seed: int = 0,
+) -> LoadTestReport:
+    """
+    Runs `calls` calls in each thread of each process. Keys are drawn from
+    range(keys), so they overlap between all threads and processes.
+    Every run uses fresh keys, so results of previous runs are not reused.
+    """
+    run = uuid.uuid4().hex
+    Store(url)  # Creates the schema before processes compete for it
+    # Processes are spawned, so they do not share database connections
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    barrier = context.Barrier(processes)
+    pool = [
+        context.Process(
+            target=_run_process,
+            args=(
+                queue,
+                barrier,
+                url,
+                run,
+                i,
+                threads,
+                keys,
+                calls,
+                work,
+                insert_ratio,
+                seed,
+            ),
+        )
+        for i in range(processes)
+    ]
+    for process in pool:
+        process.start()
+    try:
+        results = [queue.get() for _ in pool]
+    finally:
+        for process in pool:
+            process.join()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    duration = max(result.duration for result in results)
+
+    latencies = sorted(latency for r in results for latency in r.latencies)
+    outcomes = Counter()
+    computed = []
+    for result in results:
+        outcomes.update(result.outcomes)
+        computed.extend(result.computed)
+    return LoadTestReport(
+        duration=duration,
+        calls=len(latencies),
+        latencies=latencies,
+        outcomes=outcomes,
+        computations=len(computed),
+        duplicates=len(computed) - len(set(computed)),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m revault.loadtest", description=__doc__.split("\n\n")[1]
+    )
+    parser.add_argument("db_url")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=100, help="Size of the key space")
+    parser.add_argument("--calls", type=int, default=100, help="Calls per thread")
+    parser.add_argument(
+        "--work", type=float, default=0.0, help="Duration of one computation (s)"
+    )
+    parser.add_argument(
+        "--insert-ratio",
+        type=float,
+        default=0.0,
+        help="Fraction of calls that use insert_new_replica",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    report = run_loadtest(
+        args.db_url,
+        processes=args.processes,
+        threads=args.threads,
+        keys=args.keys,
+        calls=args.calls,
+        work=args.work,
+        insert_ratio=args.insert_ratio,
+        seed=args.seed,
+    )
+    print(report.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,504 @@
+import os
+import pickle
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Iterator, Sequence, Tuple
+
+from .backend import Backend
+from .blobs import Blob, BlobCache
+from .entry import AnnounceResult, EntryId, Entry, TaskId
+from .key import Key
+
+
+@dataclass
+class _Row:
+    key: Key
+    result: Any = None
+    config: dict | None = None
+    run_info: dict | None = None
+    start_date: datetime | None = None
+    finish_date: datetime | None = None
+    digest: str | None = None
+
+
+@dataclass
+class _Blob:
+    data: bytes
+    refcount: int = 0
+
+
+@dataclass
+class _Task:
+    key: Key
+    claim_date: datetime | None = None
+    worker: str | None = None
+    error: str | None = None
+
+
+class MemoryBackend(Backend):
+    """
+    Backend that keeps everything in dictionaries of the current process.
+
+    Results are stored as they are, without serialization (unless they are
+    deduplicated), so they are shared with the caller.
+    It is intended for tests and short local runs.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rows: dict[EntryId, _Row] = {}
+        # (name, version, config_key) -> replica -> entry_id
+        self.index: dict[tuple, dict[int, EntryId]] = {}
+        self.checkpoints: dict[Key, bytes] = {}
+        self.blobs: dict[str, _Blob] = {}
+        self.blob_cache = BlobCache()
+        self.tasks: dict[TaskId, _Task] = {}
+        self.task_keys: set[Key] = set()
+        self.last_entry_id = 0
+        self.last_task_id = 0
+
+    # All modifications go through _apply, so FileBackend can log them
+
+    def _apply(self, op: str, *args):
+        getattr(self, "_do_" + op)(*args)
+
+    def _do_announce(self, entry_id: EntryId, key: Key, start_date: datetime):
+        self.last_entry_id = max(self.last_entry_id, entry_id)
+        self.rows[entry_id] = _Row(key=key, start_date=start_date)
+        self.index.setdefault(_group(key), {})[key.replica] = entry_id
+
+    def _do_finish(
+        self,
+        entry_id: EntryId,
+        result: Any,
+        run_info: dict,
+        config: dict,
+        finish_date: datetime,
+        digest: str | None = None,
+    ):
+        row = self.rows.get(entry_id)
+        if row is None:
+            return
+        row.result = result
+        row.run_info = run_info
+        row.config = config
+        row.finish_date = finish_date
+        if digest is not None:
+            row.digest = digest
+            self.blobs[digest].refcount += 1
+
+    def _do_blob(self, digest: str, data: bytes):
+        if digest not in self.blobs:
+            self.blobs[digest] = _Blob(data)
+
+    def _do_delete(self, entry_id: EntryId):
+        row = self.rows.pop(entry_id, None)
+        if row is None:
+            return
+        if row.digest is not None:
+            blob = self.blobs[row.digest]
+            blob.refcount -= 1
+            if blob.refcount <= 0:
+                del self.blobs[row.digest]
+        group = _group(row.key)
+        replicas = self.index[group]
+        del replicas[row.key.replica]
+        if not replicas:
+            del self.index[group]
+
+    def _do_checkpoint(self, key: Key, data: bytes | None):
+        if data is None:
+            self.checkpoints.pop(key, None)
+        else:
+            self.checkpoints[key] = data
+
+    def _do_enqueue(self, task_id: TaskId, key: Key):
+        self.last_task_id = max(self.last_task_id, task_id)
+        self.tasks[task_id] = _Task(key=key)
+        self.task_keys.add(key)
+
+    def _do_claim(self, task_id: TaskId, worker: str, claim_date: datetime):
+        task = self.tasks[task_id]
+        task.worker = worker
+        task.claim_date = claim_date
+
+    def _do_requeue(self, task_id: TaskId):
+        task = self.tasks.get(task_id)
+        if task is not None:
+            task.claim_date = None
+            task.worker = None
+            task.error = None
+
+    def _do_finish_task(self, task_id: TaskId):
+        task = self.tasks.pop(task_id, None)
+        if task is not None:
+            self.task_keys.discard(task.key)
+
+    def _do_fail_task(self, task_id: TaskId, error: str):
+        task = self.tasks.get(task_id)
+        if task is not None:
+            task.error = error
+
+    def _result(self, row: _Row) -> Any:
+        if row.digest is None:
+            return row.result
+        return self.blob_cache.load(row.digest, self.blobs[row.digest].data)
+
+    def _find(self, key: Key) -> EntryId | None:
+        replicas = self.index.get(_group(key))
+        if replicas is None:
+            return None
+        return replicas.get(key.replica)
+
+    def get_or_announce_entry(
+        self, key: Key, expect_missing: bool = False
+    ) -> Tuple[AnnounceResult, EntryId, Any]:
+        with self.lock:
+            entry_id = self._find(key)
+            if entry_id is not None:
+                row = self.rows[entry_id]
+                if row.finish_date is None:
+                    return AnnounceResult.COMPUTING_ELSEWHERE, entry_id, None
+                return AnnounceResult.FINISHED, entry_id, self._result(row)
+            entry_id = self.last_entry_id + 1
+            self._apply("announce", entry_id, key, datetime.now())
+            return AnnounceResult.COMPUTE_HERE, entry_id, None
+
+    def finish_entry(
+        self,
+        entry_id: EntryId,
+        result: Any,
+        run_info: dict,
+        config: dict,
+        config_json: Any = None,
+        result_json: Any = None,
+        blob: Blob | None = None,
+    ):
+        with self.lock:
+            if blob is None:
+                self._apply(
+                    "finish", entry_id, result, run_info, config, datetime.now()
+                )
+                return
+            if entry_id not in self.rows:
+                return
+            digest, data = blob
+            if digest not in self.blobs:
+                self._apply("blob", digest, data)
+            self._apply(
+                "finish", entry_id, None, run_info, config, datetime.now(), digest
+            )
+
+    def cancel_entry(self, entry_id: EntryId):
+        with self.lock:
+            self._apply("delete", entry_id)
+
+    def cancel_running(self):
+        with self.lock:
+            for entry_id, row in list(self.rows.items()):
+                if row.finish_date is None:
+                    self._apply("delete", entry_id)
+
+    def load_entry(self, key: Key) -> Entry | None:
+        with self.lock:
+            entry_id = self._find(key)
+            if entry_id is None:
+                return None
+            row = self.rows[entry_id]
+            if row.finish_date is None:
+                return None
+            return Entry(entry_id=entry_id, key=key, result=self._result(row))
+
+    def load_replica_entries(self, key: Key) -> list[Entry]:
+        with self.lock:
+            replicas = self.index.get(_group(key), {})
+            return [
+                Entry(
+                    entry_id=entry_id, key=key, result=self._result(self.rows[entry_id])
+                )
+                for entry_id in sorted(replicas.values())
+                if self.rows[entry_id].finish_date is not None
+            ]
+
+    def load_replicas_many(
+        self, keys: Sequence[Key], threads: int = 1
+    ) -> dict[Key, list[Any]]:
+        with self.lock:
+            output = {}
+            for key in keys:
+                replicas = self.index.get(_group(key), {})
+                rows = [self.rows[replicas[r]] for r in sorted(replicas)]
+                output[key] = [
+                    self._result(row) for row in rows if row.finish_date is not None
+                ]
+            return output
+
+    def has_entry(self, key: Key) -> bool:
+        with self.lock:
+            entry_id = self._find(key)
+            return entry_id is not None and self.rows[entry_id].finish_date is not None
+
+    def load_key_tuples(self, names: list[str] | None) -> Iterator[tuple]:
+        with self.lock:
+            keys = [
+                row.key.tuple_key
+                for row in self.rows.values()
+                if row.finish_date is not None
+                and (names is None or row.key.name in names)
+            ]
+        return iter(keys)
+
+    def load_all_keys(self) -> list[Key]:
+        with self.lock:
+            return [row.key for row in self.rows.values()]
+
+    def query_keys(self, name: str, version: int) -> list[Key]:
+        with self.lock:
+            return [
+                row.key
+                for row in self.rows.values()
+                if row.key.name == name and row.key.version == version
+            ]
+
+    def iter_entries(self, name: str, version: int) -> Iterator[Tuple[dict, Any]]:
+        with self.lock:
+            rows = [
+                (row.config, self._result(row))
+                for row in self.rows.values()
+                if row.key.name == name
+                and row.key.version == version
+                and row.finish_date is not None
+            ]
+        return iter(rows)
+
+    def iter_entry_chunks(
+        self,
+        name: str,
+        version: int,
+        fields: Sequence[str],
+        replica: int | None,
+        chunk_size: int,
+    ) -> Iterator[Sequence[tuple]]:
+        with self.lock:
+            rows = [
+                tuple(
+                    row.key.replica
+                    if field == "replica"
+                    else self._result(row)
+                    if field == "result"
+                    else getattr(row, field)
+                    for field in fields
+                )
+                for row in self.rows.values()
+                if row.key.name == name
+                and row.key.version == version
+                and row.finish_date is not None
+                and (replica is None or row.key.replica == replica)
+            ]
+        for i in range(0, len(rows), chunk_size):
+            yield rows[i : i + chunk_size]
+
+    def remove(self, key: Key):
+        with self.lock:
+            entry_id = self._find(key)
+            if entry_id is not None:
+                self._apply("delete", entry_id)
+
+    def remove_where(
+        self,
+        name: str | None,
+        version: int | None,
+        version_lt: int | None,
+        finished_before: datetime | None,
+    ) -> int:
+        def matches(key: Key) -> bool:
+            return (
+                (name is None or key.name == name)
+                and (version is None or key.version == version)
+                and (version_lt is None or key.version < version_lt)
+            )
+
+        count = 0
+        with self.lock:
+            for entry_id, row in list(self.rows.items()):
+                if (
+                    matches(row.key)
+                    and row.finish_date is not None
+                    and (finished_before is None or row.finish_date < finished_before)
+                ):
+                    self._apply("delete", entry_id)
+                    count += 1
+            if finished_before is None:
+                for key in list(self.checkpoints):
+                    if matches(key):
+                        self._apply("checkpoint", key, None)
+        return count
+
+    def list_versions(self, name: str) -> list[int]:
+        with self.lock:
+            return sorted(
+                {row.key.version for row in self.rows.values() if row.key.name == name}
+            )
+
+    def insert_new_replica(self, key: Key, result: Any) -> int:
+        with self.lock:
+            replicas = self.index.get(_group(key))
+            replica = max(replicas) + 1 if replicas else 0
+            new_key = Key(key.name, key.version, key.config, replica, key.config_key)
+            entry_id = self.last_entry_id + 1
+            now = datetime.now()
+            self._apply("announce", entry_id, new_key, now)
+            self._apply("finish", entry_id, result, None, key.config, now)
+            return replica
+
+    def save_checkpoint(self, key: Key, data: bytes):
+        with self.lock:
+            self._apply("checkpoint", key, data)
+
+    def load_checkpoint(self, key: Key) -> bytes | None:
+        with self.lock:
+            return self.checkpoints.get(key)
+
+    def remove_checkpoint(self, key: Key):
+        with self.lock:
+            if key in self.checkpoints:
+                self._apply("checkpoint", key, None)
+
+    def enqueue(self, keys: list[Key]) -> int:
+        count = 0
+        with self.lock:
+            for key in keys:
+                if key in self.task_keys:
+                    continue
+                self._apply("enqueue", self.last_task_id + 1, key)
+                count += 1
+        return count
+
+    def claim_task(
+        self, worker: str, lease: float | None = None
+    ) -> Tuple[TaskId, Key] | None:
+        now = datetime.now()
+        expired = now - timedelta(seconds=lease) if lease is not None else None
+        with self.lock:
+            for task_id, task in self.tasks.items():
+                if task.claim_date is None:
+                    self._apply("claim", task_id, worker, now)
+                    return task_id, task.key
+                if (
+                    expired is not None
+                    and task.error is None
+                    and task.claim_date < expired
+                ):
+                    entry_id = self._find(task.key)
+                    if entry_id is not None and self.rows[entry_id].finish_date is None:
+                        self._apply("delete", entry_id)
+                    self._apply("claim", task_id, worker, now)
+                    return task_id, task.key
+            return None
+
+    def renew_task(self, task_id: TaskId):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is not None:
+                self._apply("claim", task_id, task.worker, datetime.now())
+
+    def requeue_failed_tasks(self, name: str | None) -> int:
+        count = 0
+        with self.lock:
+            for task_id, task in list(self.tasks.items()):
+                if task.error is not None and (name is None or task.key.name == name):
+                    self._apply("requeue", task_id)
+                    count += 1
+        return count
+
+    def finish_task(self, task_id: TaskId):
+        with self.lock:
+            self._apply("finish_task", task_id)
+
+    def fail_task(self, task_id: TaskId, error: str):
+        with self.lock:
+            self._apply("fail_task", task_id, error)
+
+
+class FileBackend(MemoryBackend):
+    """
+    MemoryBackend persisted into an append-only log file.
+
+    Every modification is appended to the log as a pickled record and the log
+    is replayed when the backend is opened. The file must not be shared by
+    several processes at the same time.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.file = None
+
+    def init(self):
+        with self.lock:
+            if self.file is not None:
+                return
+            end = 0
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    while True:
+                        try:
+                            op, args = pickle.load(f)
+                        except (EOFError, pickle.UnpicklingError):
+                            break
+                        super()._apply(op, *args)
+                        end = f.tell()
+            self.file = open(self.path, "ab")
+            # Drop a partially written record left by a crash
+            self.file.truncate(end)
+
+    def _records(self):
+        """Yields records that rebuild the current state"""
+        for digest, blob in self.blobs.items():
+            yield "blob", (digest, blob.data)
+        for entry_id, row in self.rows.items():
+            yield "announce", (entry_id, row.key, row.start_date)
+            if row.finish_date is not None:
+                yield (
+                    "finish",
+                    (
+                        entry_id,
+                        row.result,
+                        row.run_info,
+                        row.config,
+                        row.finish_date,
+                        row.digest,
+                    ),
+                )
+        for key, data in self.checkpoints.items():
+            yield "checkpoint", (key, data)
+        for task_id, task in self.tasks.items():
+            yield "enqueue", (task_id, task.key)
+            if task.claim_date is not None:
+                yield "claim", (task_id, task.worker, task.claim_date)
+            if task.error is not None:
+                yield "fail_task", (task_id, task.error)
+
+    def compact(self, full: bool = False) -> int:
+        """Rewrites the log, so it contains only records of the current state"""
+        with self.lock:
+            before = self.file.tell()
+            tmp_path = self.path + ".compact"
+            with open(tmp_path, "wb") as f:
+                for record in self._records():
+                    pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.file.close()
+            os.replace(tmp_path, self.path)
+            self.file = open(self.path, "ab")
+            return before - self.file.tell()
+
+    def _apply(self, op: str, *args):
+        data = pickle.dumps((op, args), protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.write(data)
+        self.file.flush()
+        super()._apply(op, *args)
+
+
+def _group(key: Key) -> tuple:
+    return key.name, key.version, key.config_key
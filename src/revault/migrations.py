@@ -0,0 +1,47 @@
+"""
+Versioned schema of SQL databases.
+
+Each migration upgrades the schema of an existing vault by one version.
+Tables that are missing altogether are created by `metadata.create_all`
+before migrations run, so migrations only alter existing tables.
+"""
+
+from typing import TYPE_CHECKING, Callable
+
+import sqlalchemy as sa
+
+if TYPE_CHECKING:
+    from .database import Database
+
+
+def _add_result_digest(db: "Database", conn: sa.Connection):
+    columns = {c["name"] for c in sa.inspect(conn).get_columns("entries")}
+    if "result_digest" not in columns:
+        conn.execute(
+            sa.text("ALTER TABLE entries ADD COLUMN result_digest VARCHAR(64)")
+        )
+
+
+def _add_entries_indexes(db: "Database", conn: sa.Connection):
+    for index in db.entries.indexes:
+        index.create(conn, checkfirst=True)
+
+
+# MIGRATIONS[i] upgrades the schema from version i to version i + 1
+MIGRATIONS: list[Callable[["Database", sa.Connection], None]] = [
+    _add_result_digest,
+    _add_entries_indexes,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(db: "Database", conn: sa.Connection, version: int) -> int:
+    if version > SCHEMA_VERSION:
+        raise Exception(
+            f"Database schema has version {version}, "
+            f"but this version of revault supports only up to {SCHEMA_VERSION}"
+        )
+    for migration in MIGRATIONS[version:]:
+        migration(db, conn)
+    return SCHEMA_VERSION
@@ -1,23 +1,42 @@
+import json
+import logging
+import pickle
 import threading
+import time
+from datetime import datetime
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from contextvars import ContextVar
-from typing import Union, Any
+from typing import Union, Any, Callable, Iterable, Iterator, Sequence, Tuple
 from threading import Lock
 from dataclasses import dataclass, field
 
 from .comp import Ref, ToKey, to_key
-from .database import Database
-from .entry import AnnounceResult, EntryId, Entry
+from .aggregate import parse_metrics
+from .backend import create_backend
+from .blobs import make_blob
+from .checkpoint import CheckpointWriter
+from .frame import ENTRY_FIELDS, build_frame
+from .hooks import StoreHook
+from .index import KeyIndex
+from .entry import AnnounceResult, EntryId, Entry, TaskId
 from .key import Key
 
+logger = logging.getLogger(__name__)
+
 
 _GLOBAL_STORE: ContextVar[Union[None, "Store"]] = ContextVar(
     "_GLOBAL_STORE", default=None
 )
 
 
-@dataclass
+@dataclass(eq=False)
 class RunningTask:
+    key: Key | None = None
+    parent: Union[None, "RunningTask"] = None
+    store: Union[None, "Store"] = None
     deps: set[EntryId] = field(default_factory=set)
+    has_checkpoint: bool = False
 
 
 _CURRENT_RUNNING_TASK: ContextVar[Union[None, RunningTask]] = ContextVar(
@@ -54,6 +73,54 @@ class WaitingForResult:
         self.condition.notify_all()
 
 
+class _TimedBackend:
+    """Backend wrapper that reports duration of each call to hooks of the store"""
+
+    def __init__(self, backend, store: "Store"):
+        self.backend = backend
+        self.store = store
+
+    def __getattr__(self, name):
+        value = getattr(self.backend, name)
+        if name.startswith("_") or not callable(value):
+            return value
+
+        def wrapper(*args, **kwargs):
+            task = _CURRENT_RUNNING_TASK.get()
+            start = time.perf_counter()
+            try:
+                result = value(*args, **kwargs)
+            except BaseException:
+                self._report(name, time.perf_counter() - start, task)
+                raise
+            duration = time.perf_counter() - start
+            if isinstance(result, Iterator):
+                # Queries of generators run while they are consumed
+                return self._timed_iter(name, result, duration, task)
+            self._report(name, duration, task)
+            return result
+
+        return wrapper
+
+    def _timed_iter(self, name: str, it: Iterator, duration: float, task):
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                finally:
+                    duration += time.perf_counter() - start
+                yield item
+        finally:
+            self._report(name, duration, task)
+
+    def _report(self, name: str, duration: float, task):
+        for hook in self.store.hooks:
+            hook.on_db_query(name, duration, task)
+
+
 class Store:
     """
     Core class of revault.
@@ -67,15 +134,68 @@ class Store:
     For Postgress:
 
     >>> runtime = Store("postgresql://<USERNAME>:<PASSWORD>@<HOSTNAME>/<DATABASE>")
+
+    In-memory store (e.g. for tests):
+
+    >>> runtime = Store("memory://")
+
+    Store in an append-only log file:
+
+    >>> runtime = Store("file:///path/to/logfile")
     """
 
     def __init__(self, db_path: str):
-        self.db = Database(db_path)
+        self.db = create_backend(db_path)
         self.db.init()
         self._token = None
 
         self.lock = Lock()
         self.waiting_for_results: dict[Key, WaitingForResult | None] = {}
+        self.hooks: tuple[StoreHook, ...] = ()
+        self._checkpoint_writer: CheckpointWriter | None = None
+        self.key_index: KeyIndex | None = None
+
+    def snapshot_index(
+        self,
+        names: Iterable[str] | None = None,
+        refresh_interval: float | None = 60.0,
+        bloom: bool = False,
+    ) -> KeyIndex:
+        """
+        Loads keys of finished entries (of computations with given names)
+        into memory. Loads of keys that are known to be missing then return
+        without asking the database, and computing them skips the initial lookup.
+
+        The index is updated by writes of this store and reloaded from
+        the database after `refresh_interval` seconds, so entries stored
+        by other processes may be invisible to loads for up to that time.
+        With `bloom=True` only a Bloom filter of keys is kept (for huge vaults);
+        it can answer only that a key is missing.
+        """
+        self.key_index = KeyIndex(
+            lambda names: self.db.load_key_tuples(names),
+            names,
+            refresh_interval,
+            bloom,
+        )
+        return self.key_index
+
+    def drop_index(self):
+        self.key_index = None
+
+    def add_hook(self, hook: StoreHook):
+        """
+        Registers a hook that observes operations of the store (see StoreHook).
+        Without hooks, the store does not measure anything.
+        """
+        if not self.hooks:
+            self.db = _TimedBackend(self.db, self)
+        self.hooks += (hook,)
+
+    def remove_hook(self, hook: StoreHook):
+        self.hooks = tuple(h for h in self.hooks if h is not hook)
+        if not self.hooks and isinstance(self.db, _TimedBackend):
+            self.db = self.db.backend
 
     def get(self, ref: Ref) -> Any:
         return self.get_entry(ref).result
@@ -84,40 +204,230 @@ class Store:
         if not isinstance(ref, Ref):
             raise Exception(f"Expected Ref, got {ref.__class__.__name__}")
         key = ref.key
+        hooks = self.hooks
+        # Outside of the lock, as it may reload the whole index
+        index = self.key_index
+        expect_missing = index is not None and index.contains(key) is False
 
         with self.lock:
             if key in self.waiting_for_results:
                 waiting = self.waiting_for_results[key]
+                if hooks:
+                    start = time.perf_counter()
                 result, entry_id = waiting.wait(self.lock)
+                if hooks:
+                    duration = time.perf_counter() - start
+                    for hook in hooks:
+                        hook.on_wait(key, duration)
                 return Entry(entry_id, key, result)
-            status, entry_id, result = self.db.get_or_announce_entry(key)
+            status, entry_id, result = self.db.get_or_announce_entry(
+                key, expect_missing
+            )
             if status == AnnounceResult.FINISHED:
+                for hook in hooks:
+                    hook.on_hit(key)
                 return Entry(entry_id, key, result)
             elif status == AnnounceResult.COMPUTING_ELSEWHERE:
                 raise Exception(f"Computation {ref} is computed in another process")
             assert status == AnnounceResult.COMPUTE_HERE
+            for hook in hooks:
+                hook.on_miss(key)
             waiting = WaitingForResult()
             self.waiting_for_results[key] = waiting
+        running_task = RunningTask(
+            key=key, parent=_CURRENT_RUNNING_TASK.get(), store=self
+        )
+        if hooks:
+            for hook in hooks:
+                hook.on_compute_start(running_task)
+            start = time.perf_counter()
+        token = _CURRENT_RUNNING_TASK.set(running_task)
         try:
-            running_task = RunningTask()
-            token = _CURRENT_RUNNING_TASK.set(running_task)
             result = ref.computation.fn(**ref.args)
+        except BaseException as e:
             _CURRENT_RUNNING_TASK.reset(token)
+            if hooks:
+                duration = time.perf_counter() - start
+                for hook in hooks:
+                    hook.on_compute_end(running_task, duration, e)
+            if running_task.has_checkpoint:
+                # Keep the checkpoint, so the next run can resume from it
+                try:
+                    self._checkpoint_writer.flush(key)
+                except Exception:
+                    pass  # Logged by the writer, do not hide the original error
+            self._cancel_entry(key, entry_id, waiting, e)
+            raise e
+        _CURRENT_RUNNING_TASK.reset(token)
+        if hooks:
+            duration = time.perf_counter() - start
+            for hook in hooks:
+                hook.on_compute_end(running_task, duration, None)
+        if running_task.has_checkpoint:
+            # The result is already computed, so failures of checkpoint
+            # cleanup are only logged
+            try:
+                self._checkpoint_writer.flush(key)
+            except Exception:
+                pass  # Logged by the writer
+            try:
+                self.db.remove_checkpoint(key)
+            except Exception:
+                logger.exception("Removing checkpoint of %s failed", key)
+        computation = ref.computation
+        # Values that are not JSON are stored without JSON columns;
+        # aggregations over them fall back to Python
+        config_json = _json_or_none(key.config) if computation.json_inputs else None
+        result_json = _json_or_none(result) if computation.json_result else None
+        try:
+            self.db.finish_entry(
+                entry_id,
+                result,
+                {},
+                key.config,
+                config_json=config_json,
+                result_json=result_json,
+                blob=make_blob(result) if computation.dedup_result else None,
+            )
         except BaseException as e:
-            self.db.cancel_entry(entry_id)
-            with self.lock:
-                del self.waiting_for_results[key]
-                waiting.set_exception(e)
+            self._cancel_entry(key, entry_id, waiting, e)
             raise e
-        self.db.finish_entry(entry_id, result, {}, key.config)
+        if self.key_index is not None:
+            self.key_index.add(key)
         with self.lock:
             del self.waiting_for_results[key]
             waiting.set_result(result, entry_id)
         return Entry(entry_id, key, result)
 
+    def _cancel_entry(
+        self, key: Key, entry_id: EntryId, waiting: WaitingForResult, error
+    ):
+        self.db.cancel_entry(entry_id)
+        with self.lock:
+            del self.waiting_for_results[key]
+            waiting.set_exception(error)
+
+    def save_checkpoint(self, key: Key, state: Any):
+        data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            if self._checkpoint_writer is None:
+                self._checkpoint_writer = CheckpointWriter(
+                    lambda key, data: self.db.save_checkpoint(key, data)
+                )
+        self._checkpoint_writer.write(key, data)
+
+    def load_checkpoint(self, key: Key, default: Any = None) -> Any:
+        data = None
+        if self._checkpoint_writer is not None:
+            data = self._checkpoint_writer.get(key)
+        if data is None:
+            data = self.db.load_checkpoint(key)
+        if data is None:
+            return default
+        return pickle.loads(data)
+
+    def iter_completed(
+        self,
+        refs: Iterable[Ref],
+        parallel: int = 1,
+        until: Callable[[list[Entry]], bool] | None = None,
+    ) -> Iterator[Entry]:
+        """
+        Computes (or loads) refs and yields entries as they are finished,
+        with at most `parallel` refs in progress at once.
+
+        `until` is called with the list of all yielded entries after each entry;
+        when it returns True, no more refs are started. Refs that are already
+        running are finished (and stored) before the generator ends.
+        """
+        done = []
+        if parallel <= 1:
+            for ref in refs:
+                entry = self.get_entry(ref)
+                done.append(entry)
+                yield entry
+                if until is not None and until(done):
+                    return
+            return
+
+        refs = iter(refs)
+        running = set()
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+
+            def submit():
+                ref = next(refs, None)
+                if ref is not None:
+                    context = contextvars.copy_context()
+                    running.add(executor.submit(context.run, self.get_entry, ref))
+
+            for _ in range(parallel):
+                submit()
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    running.remove(future)
+                    entry = future.result()
+                    done.append(entry)
+                    yield entry
+                    if until is not None and until(done):
+                        return
+                    submit()
+
     def remove(self, key: ToKey):
         key = to_key(key)
         self.db.remove(key)
+        if self.key_index is not None:
+            self.key_index.discard(key)
+
+    def remove_where(
+        self,
+        name: str | None = None,
+        *,
+        version: int | None = None,
+        version_lt: int | None = None,
+        finished_before: datetime | None = None,
+    ) -> int:
+        """
+        Removes all finished entries that match all given conditions by a single
+        operation. Returns the number of removed entries. Entries that are
+        being computed are kept (see cancel_running).
+
+        >>> store.remove_where("my_computation", version_lt=3)
+        """
+        if (
+            name is None
+            and version is None
+            and version_lt is None
+            and (finished_before is None)
+        ):
+            raise Exception("At least one condition has to be given")
+        count = self.db.remove_where(name, version, version_lt, finished_before)
+        if self.key_index is not None:
+            self.key_index.invalidate()
+        return count
+
+    def compact(self, full: bool = False) -> int:
+        """
+        Reclaims space freed by removed entries (VACUUM + ANALYZE for databases)
+        and returns the number of freed bytes.
+
+        For PostgreSQL, `full=True` runs VACUUM FULL that returns space to
+        the operating system, but locks tables while running.
+        """
+        return self.db.compact(full)
+
+    def explain(self, query) -> list[str]:
+        """
+        Returns the query plan of an SQLAlchemy statement or an SQL string,
+        e.g. to check that a query uses indexes:
+
+        >>> entries = store.db.entries
+        >>> store.explain(sa.select(entries).where(entries.c.finish_date == None))
+        """
+        return self.db.explain(query)
+
+    def list_versions(self, name: str) -> list[int]:
+        return self.db.list_versions(name)
 
     def load(self, key: ToKey):
         return self.load_entry(key).result
@@ -142,13 +452,72 @@ class Store:
     def load_replicas(self, key: ToKey) -> list:
         return [entry.result for entry in self.load_replica_entries(key)]
 
+    def load_replicas_many(
+        self, keys: Iterable[ToKey], threads: int = 4
+    ) -> dict[Key, list]:
+        """
+        Loads results of all finished replicas of many keys at once.
+        Returns a mapping from each key to its results ordered by replica
+        (an empty list when no replica is finished). Results are
+        deserialized in `threads` threads.
+        """
+        return self.db.load_replicas_many([to_key(key) for key in keys], threads)
+
     def load_entry_or_none(self, key: ToKey):
-        return self.db.load_entry(to_key(key))
+        key = to_key(key)
+        if self.key_index is not None and self.key_index.contains(key) is False:
+            return None
+        return self.db.load_entry(key)
+
+    def contains(self, key: ToKey) -> bool:
+        """Returns True if the key has a finished entry"""
+        key = to_key(key)
+        if self.key_index is not None:
+            found = self.key_index.contains(key)
+            if found is not None:
+                return found
+        return self.db.has_entry(key)
 
     def insert_new_replica(self, key: ToKey, result) -> Key:
         key = to_key(key)
         replica = self.db.insert_new_replica(key, result)
-        return Key(key.name, key.version, key.config, replica, key.config_key)
+        new_key = Key(key.name, key.version, key.config, replica, key.config_key)
+        if self.key_index is not None:
+            self.key_index.add(new_key)
+        return new_key
+
+    def enqueue(self, keys: Iterable[ToKey]) -> int:
+        """
+        Puts keys into the task queue processed by `revault worker`.
+        Returns the number of newly queued tasks, already queued keys are skipped.
+        """
+        return self.db.enqueue([to_key(key) for key in keys])
+
+    def claim_task(
+        self, worker: str, lease: float | None = None
+    ) -> Tuple[TaskId, Key] | None:
+        """
+        Claims a task from the queue. With `lease` (in seconds), tasks claimed
+        by workers that did not renew their claim within the lease are
+        claimed again.
+        """
+        return self.db.claim_task(worker, lease)
+
+    def renew_task(self, task_id: TaskId):
+        self.db.renew_task(task_id)
+
+    def requeue_failed_tasks(self, name: str | None = None) -> int:
+        """
+        Makes failed tasks (of the computation with the given name) claimable
+        again. Returns the number of requeued tasks.
+        """
+        return self.db.requeue_failed_tasks(name)
+
+    def finish_task(self, task_id: TaskId):
+        self.db.finish_task(task_id)
+
+    def fail_task(self, task_id: TaskId, error: str):
+        self.db.fail_task(task_id, error)
 
     # def query(self, name: Computation) -> list[Key]:
     #     return self.db.query_by_name(name)
@@ -156,6 +525,44 @@ class Store:
     def query_keys(self, computation: "Computation") -> list[Key]:
         return self.db.query_keys(computation.name, computation.version)
 
+    def aggregate(
+        self,
+        computation: "Computation",
+        group_by: list[str] | None = None,
+        metrics: dict | None = None,
+    ) -> list[dict]:
+        return self.db.aggregate(
+            computation.name,
+            computation.version,
+            list(group_by or ()),
+            parse_metrics(metrics or {"count": ("count", None)}),
+            computation.json_inputs,
+            computation.json_result,
+        )
+
+    def to_frame(
+        self,
+        computation: "Computation",
+        fields: Sequence[str] | None = None,
+        replicas: bool = True,
+        chunk_size: int = 1000,
+    ):
+        if fields is None:
+            fields = ("config", "replica", "result")
+        for name in fields:
+            if name not in ENTRY_FIELDS:
+                raise Exception(
+                    f"Invalid field {name!r}, expected one of {ENTRY_FIELDS}"
+                )
+        chunks = self.db.iter_entry_chunks(
+            computation.name,
+            computation.version,
+            tuple(fields),
+            None if replicas else 0,
+            chunk_size,
+        )
+        return build_frame(chunks, fields)
+
     def all_keys(self) -> list[Key]:
         return self.db.load_all_keys()
 
@@ -171,6 +578,52 @@ class Store:
         self._token = None
 
 
+def _json_or_none(value: Any) -> Any:
+    """Returns the value if it can be stored as JSON, otherwise None"""
+    try:
+        json.dumps(value, allow_nan=False)
+    except (TypeError, ValueError):
+        return None
+    return value
+
+
+def _get_running_task() -> RunningTask:
+    task = _CURRENT_RUNNING_TASK.get()
+    if task is None:
+        raise Exception("Checkpoints can be used only inside a running computation")
+    return task
+
+
+def checkpoint(state: Any):
+    """
+    Stores intermediate state of the running computation.
+
+    If the computation fails, the next computation of the same key can get
+    the state by `last_checkpoint()`. The state is serialized immediately and
+    written to the database in a background thread.
+    The checkpoint is removed when the computation finishes.
+    """
+    task = _get_running_task()
+    task.has_checkpoint = True
+    task.store.save_checkpoint(task.key, state)
+
+
+def last_checkpoint(default: Any = None) -> Any:
+    """
+    Returns the last state stored by `checkpoint()` for the running computation
+    (possibly in a previous run that failed) or `default` if there is none.
+    """
+    task = _get_running_task()
+    state = task.store.load_checkpoint(task.key, _NO_CHECKPOINT)
+    if state is _NO_CHECKPOINT:
+        return default
+    task.has_checkpoint = True
+    return state
+
+
+_NO_CHECKPOINT = object()
+
+
 def get_current_store() -> Store:
     runtime = _GLOBAL_STORE.get()
     if runtime is None:
@@ -0,0 +1,89 @@
+import contextlib
+import os
+import socket
+import threading
+import time
+import traceback
+import logging
+
+from .comp import get_computation
+from .entry import TaskId
+from .store import Store
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@contextlib.contextmanager
+def _renewing(store: Store, task_id: TaskId, lease: float | None):
+    """Renews the claim of the task in a background thread"""
+    if lease is None:
+        yield
+        return
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(lease / 3):
+            try:
+                store.renew_task(task_id)
+            except Exception:
+                logger.exception("Renewing task %s failed", task_id)
+
+    thread = threading.Thread(target=renew, name="revault-lease", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_worker(
+    store: Store,
+    *,
+    name: str | None = None,
+    max_tasks: int | None = None,
+    poll_interval: float | None = None,
+    lease: float | None = None,
+) -> int:
+    """
+    Claims tasks from the queue of the store and computes them.
+
+    Computations are resolved by name and version, so modules that define them
+    have to be imported before the worker starts. A failed task stays claimed
+    with its error recorded until it is requeued by `Store.requeue_failed_tasks`.
+
+    With `lease` (in seconds), the worker renews claims of its running tasks
+    and takes over tasks of workers that have not renewed them within the lease
+    (e.g. because they died). All workers of a queue should use the same lease.
+
+    When `poll_interval` is None, the worker stops as soon as the queue is empty,
+    otherwise it waits for new tasks. Returns the number of processed tasks.
+    """
+    if name is None:
+        name = default_worker_name()
+    processed = 0
+    with store:
+        while max_tasks is None or processed < max_tasks:
+            task = store.claim_task(name, lease)
+            if task is None:
+                if poll_interval is None:
+                    break
+                time.sleep(poll_interval)
+                continue
+            task_id, key = task
+            logger.info("Computing %s", key)
+            try:
+                computation = get_computation(key.name, key.version)
+                with _renewing(store, task_id, lease):
+                    store.get_entry(computation.ref_from_key(key))
+            except Exception:
+                logger.exception("Task %s failed", key)
+                store.fail_task(task_id, traceback.format_exc())
+            else:
+                store.finish_task(task_id)
+            processed += 1
+    return processed
@@ -8,7 +8,18 @@ PYTEST_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.dirname(PYTEST_DIR)
 
 
+@pytest.fixture(params=["sqlite", "memory", "file"])
+def store(request, tmpdir):
+    if request.param == "sqlite":
+        path = str(tmpdir.join("test.db"))
+        return Store("sqlite:///" + path)
+    if request.param == "memory":
+        return Store("memory://")
+    path = str(tmpdir.join("test.log"))
+    return Store("file://" + path)
+
+
 @pytest.fixture()
-def store(tmpdir):
+def sqlite_store(tmpdir):
     path = str(tmpdir.join("test.db"))
     return Store("sqlite:///" + path)
@@ -0,0 +1,125 @@
+import pytest
+
+from revault import computation
+
+
+def _sorted(rows):
+    return sorted(rows, key=lambda r: r["lr"])
+
+
+@pytest.mark.parametrize("json", [False, True])
+def test_aggregate(store, json):
+    @computation(json_inputs=json, json_result=json)
+    def train(lr, seed):
+        return {"accuracy": lr * 10 + seed, "info": {"steps": seed}}
+
+    with store:
+        for lr in [1, 2]:
+            for seed in range(4):
+                train(lr, seed)
+
+        assert _sorted(
+            train.aggregate(
+                group_by=["lr"],
+                metrics={
+                    "mean": "result.accuracy",
+                    "max": "result.info.steps",
+                    "n": ("count", None),
+                    "s": ("sum", "config.seed"),
+                },
+            )
+        ) == [
+            {"lr": 1, "mean": 11.5, "max": 3, "n": 4, "s": 6},
+            {"lr": 2, "mean": 21.5, "max": 3, "n": 4, "s": 6},
+        ]
+        assert train.aggregate() == [{"count": 8}]
+        assert train.aggregate(metrics={"min": "result.accuracy"}) == [{"min": 10}]
+        assert train.aggregate(metrics={"count": "result.missing"}) == [{"count": 0}]
+
+
+def test_aggregate_scalar_result(store):
+    @computation(json_result=True)
+    def scalar(x):
+        return x / 2
+
+    with store:
+        scalar(1)
+        scalar(2)
+        assert scalar.aggregate(metrics={"sum": "result"}) == [{"sum": 1.5}]
+
+
+def test_aggregate_invalid(store):
+    @computation
+    def fn(x):
+        return x
+
+    with store:
+        with pytest.raises(Exception, match="Invalid aggregation"):
+            fn.aggregate(metrics={"median": "result"})
+        with pytest.raises(Exception, match="has to start"):
+            fn.aggregate(metrics={"mean": "x"})
+
+
+def test_aggregate_non_json_values(store):
+    @computation(json_inputs=True, json_result=True)
+    def nj_fn(x):
+        return {1, 2} if x == 0 else float("nan") if x == 1 else x
+
+    with store:
+        assert nj_fn(0) == {1, 2}
+        assert nj_fn(0) == {1, 2}
+        nj_fn(2)
+        nj_fn(3)
+        # The set is not stored as JSON, so the entries are aggregated in Python
+        assert nj_fn.aggregate(metrics={"count": "result"}) == [{"count": 3}]
+        nj_fn(1)
+        assert nj_fn.aggregate(metrics={"count": "result"}) == [{"count": 4}]
+        assert sorted(r["x"] for r in nj_fn.aggregate(group_by=["x"])) == [0, 1, 2, 3]
+
+
+def test_finish_error_cancels_entry(store, monkeypatch):
+    @computation
+    def fe_fn(x):
+        return x
+
+    def finish_entry(*args, **kwargs):
+        raise RuntimeError("finish failed")
+
+    with store:
+        with monkeypatch.context() as m:
+            m.setattr(store.db, "finish_entry", finish_entry)
+            with pytest.raises(RuntimeError, match="finish failed"):
+                fe_fn(1)
+        assert fe_fn(1) == 1
+
+
+@pytest.mark.parametrize("json", [False, True])
+def test_aggregate_types(store, json):
+    @computation(json_inputs=json, json_result=json)
+    def ty_fn(x):
+        return {"n": x, "s": "abc"[x]}
+
+    with store:
+        assert ty_fn.aggregate(metrics={"count": None, "sum": "result.n"}) == [
+            {"count": 0, "sum": None}
+        ]
+        for x in range(3):
+            ty_fn(x)
+        rows = ty_fn.aggregate(
+            metrics={"sum": "result.n", "max": "result.n", "mean": "result.n"}
+        )
+        assert rows == [{"sum": 3.0, "max": 2.0, "mean": 1.0}]
+        assert all(type(v) is float for v in rows[0].values())
+
+
+def test_aggregate_non_numeric(store):
+    @computation
+    def nn_fn(x):
+        return {"s": "abc"[x], "v": x if x else "zero"}
+
+    with store:
+        for x in range(3):
+            nn_fn(x)
+        assert nn_fn.aggregate(
+            metrics={"min": "result.s", "max": "result.s", "sum": "result.v"}
+        ) == [{"min": "a", "max": "c", "sum": 3.0}]
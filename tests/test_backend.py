@@ -0,0 +1,60 @@
+from revault import Store, computation
+from revault.database import Database
+from revault.entry import AnnounceResult
+from revault.memory import MemoryBackend, FileBackend
+from revault import Key
+
+
+def test_backend_from_url(tmpdir):
+    assert isinstance(Store("memory://").db, MemoryBackend)
+    assert isinstance(Store("file://" + str(tmpdir.join("log"))).db, FileBackend)
+    assert isinstance(Store("sqlite:///" + str(tmpdir.join("db"))).db, Database)
+
+
+def test_file_backend_reopen(tmpdir):
+    path = "file://" + str(tmpdir.join("test.log"))
+
+    @computation
+    def fb_fn(x):
+        return x * 10
+
+    store = Store(path)
+    with store:
+        assert fb_fn(1) == 10
+        assert fb_fn(2) == 20
+        fb_fn.remove(2)
+    store.insert_new_replica(fb_fn.ref(1), "a")
+    store.db.get_or_announce_entry(Key("fb_fn", 0, {"x": 3}, 0))
+    store.db.file.close()
+
+    store = Store(path)
+    with store:
+        assert fb_fn.load_replicas(1) == [10, "a"]
+        assert fb_fn.load_or_none(2) is None
+        r = store.db.get_or_announce_entry(Key("fb_fn", 0, {"x": 3}, 0))
+        assert r[0] == AnnounceResult.COMPUTING_ELSEWHERE
+        store.cancel_running()
+        assert len(fb_fn.keys()) == 2
+
+
+def test_file_backend_truncated(tmpdir):
+    path = str(tmpdir.join("test.log"))
+    db = FileBackend(path)
+    db.init()
+    key = Key("test", 1, {"x": 10}, 0)
+    _, entry_id, _ = db.get_or_announce_entry(key)
+    db.finish_entry(entry_id, "Hello", {}, key.config)
+    db.file.close()
+
+    with open(path, "ab") as f:
+        f.write(b"\x80\x05\x95")
+
+    db = FileBackend(path)
+    db.init()
+    assert db.load_entry(key).result == "Hello"
+    db.insert_new_replica(key, "World")
+    db.file.close()
+
+    db = FileBackend(path)
+    db.init()
+    assert [e.result for e in db.load_replica_entries(key)] == ["Hello", "World"]
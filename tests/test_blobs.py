@@ -0,0 +1,95 @@
+from revault import computation, Store
+
+
+def test_dedup_results(store):
+    @computation(dedup_result=True)
+    def dd_fn(x):
+        return {"data": list(range(1000)), "parity": x % 2}
+
+    with store:
+        for x in range(4):
+            dd_fn(x)
+        dd_fn(0, replica=1)
+        assert dd_fn.load(0) == {"data": list(range(1000)), "parity": 0}
+        assert dd_fn.load(0) is dd_fn.load(2)
+        assert dd_fn.load_replicas(0) == [dd_fn.load(0)] * 2
+        assert dd_fn(1)["parity"] == 1
+        assert dd_fn.aggregate(metrics={"sum": "result.parity"}) == [{"sum": 2}]
+
+        db = store.db
+        if hasattr(db, "blobs") and isinstance(db.blobs, dict):
+            assert sorted(b.refcount for b in db.blobs.values()) == [2, 3]
+
+        dd_fn.remove(0)
+        dd_fn.remove(0, replica=1)
+        dd_fn.remove(2)
+        assert dd_fn.load_or_none(0) is None
+        assert dd_fn.load(1)["parity"] == 1
+        assert store.remove_where("dd_fn") == 2
+        assert dd_fn.load_or_none(1) is None
+
+
+def test_dedup_sqlite_refcount(sqlite_store):
+    import sqlalchemy as sa
+
+    @computation(dedup_result=True)
+    def dd_sql(x):
+        return "a" * 1000 if x < 3 else "b" * 1000
+
+    def blobs():
+        db = sqlite_store.db
+        with db.engine.connect() as conn:
+            return sorted(conn.execute(sa.select(db.blobs.c.refcount)).scalars().all())
+
+    with sqlite_store:
+        for x in range(5):
+            dd_sql(x)
+        assert blobs() == [2, 3]
+        dd_sql.remove(0)
+        assert blobs() == [2, 2]
+        sqlite_store.remove_where("dd_sql")
+        assert blobs() == []
+
+
+def test_dedup_file_reopen(tmpdir):
+    url = "file://" + str(tmpdir.join("test.log"))
+
+    @computation(dedup_result=True)
+    def dd_file(x):
+        return "a" * 1000
+
+    store = Store(url)
+    with store:
+        dd_file(1)
+        dd_file(2)
+        dd_file(3)
+        dd_file.remove(3)
+    store.compact()
+    store.db.file.close()
+
+    store = Store(url)
+    with store:
+        assert dd_file.load(1) == "a" * 1000
+        assert dd_file.load(2) is dd_file.load(1)
+        assert store.db.blobs[next(iter(store.db.blobs))].refcount == 2
+
+
+def test_dedup_entry_removed_while_computing(store):
+    @computation(dedup_result=True)
+    def dd_gone(x):
+        # Another process cleans up running entries meanwhile
+        store.cancel_running()
+        return "a" * 1000
+
+    with store:
+        assert dd_gone(1) == "a" * 1000
+        assert dd_gone.load_or_none(1) is None
+
+    db = store.db
+    if isinstance(db.blobs, dict):
+        assert db.blobs == {}
+    else:
+        import sqlalchemy as sa
+
+        with db.engine.connect() as conn:
+            assert conn.execute(sa.select(db.blobs.c.refcount)).all() == []
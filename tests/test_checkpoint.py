@@ -0,0 +1,62 @@
+import pytest
+
+from revault import computation, checkpoint, last_checkpoint, Store
+
+
+def test_checkpoint_in_same_run(store):
+    @computation
+    def ck_fn(n):
+        assert last_checkpoint() is None
+        for i in range(n):
+            checkpoint({"i": i})
+            assert last_checkpoint() == {"i": i}
+        return n
+
+    with store:
+        assert ck_fn(100) == 100
+        assert store.db.load_checkpoint(ck_fn.ref(100).key) is None
+
+
+def test_checkpoint_resume_same_key(store):
+    attempts = [0]
+
+    @computation
+    def ck_fn2(n):
+        state = last_checkpoint(0)
+        attempts[0] += 1
+        for i in range(state, n):
+            if attempts[0] == 1 and i == 3:
+                raise Exception("Crash")
+            checkpoint(i + 1)
+        return state
+
+    with store:
+        with pytest.raises(Exception, match="Crash"):
+            ck_fn2(5)
+        assert ck_fn2(5) == 3
+        assert store.db.load_checkpoint(ck_fn2.ref(5).key) is None
+        assert ck_fn2.load(5) == 3
+
+
+def test_checkpoint_outside_computation():
+    with pytest.raises(Exception, match="inside a running computation"):
+        checkpoint(1)
+
+
+def test_checkpoint_write_error(monkeypatch):
+    store = Store("memory://")
+
+    def save_checkpoint(key, data):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(store.db, "save_checkpoint", save_checkpoint)
+
+    @computation
+    def ck_fail(n):
+        checkpoint(n)
+        return n
+
+    with store:
+        assert ck_fail(1) == 1
+        assert ck_fail(1) == 1
+        assert ck_fail.load(1) == 1
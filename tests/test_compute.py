@@ -1,6 +1,8 @@
 from revault import computation
 import pytest
+import functools
 import inspect
+import math
 import time
 import concurrent.futures
 
@@ -194,3 +196,127 @@ def test_compute_in_threads_fail(store):
             with pytest.raises(TestException):
                 a.result()
             assert store.load_entry_or_none(my_fn.ref(10)) is None
+
+
+def test_compute_binder():
+    from revault.comp import _make_generic_binder
+
+    def fn1(a, b=2, *, c, d=4):
+        pass
+
+    def fn2(a, __b, c=3, **kw):
+        pass
+
+    def fn3(a, /, b, *args):
+        pass
+
+    class Obj:
+        def method(self, x, y=2):
+            pass
+
+        def __call__(self, x, y=2):
+            pass
+
+    def inner(x, y=2):
+        pass
+
+    @functools.wraps(inner)
+    def wrapped(*a, **k):
+        pass
+
+    calls = [
+        (Obj().method, (1,), {}),
+        (Obj().method, (1, 3), {}),
+        (Obj(), (1,), {"y": 3}),
+        (Obj(), (1, 2, 3), {}),
+        (wrapped, (1,), {}),
+        (wrapped, (1,), {"y": 5}),
+        (wrapped, (1,), {"z": 5}),
+        (fn1, (1,), {"c": 3}),
+        (fn1, (), {"c": 3, "a": 1, "d": 5}),
+        (fn1, (1, 2, 3), {"c": 3}),
+        (fn1, (1,), {"a": 1, "c": 3}),
+        (fn1, (1,), {}),
+        (fn1, (1,), {"c": 3, "e": 5}),
+        (fn2, (1, 2), {"z": 1, "kw": 2}),
+        (fn2, (1, 2, 3), {"__y": 1}),
+        (fn3, (1, 2, 3, 4), {}),
+        (fn3, (), {"a": 1, "b": 2}),
+    ]
+    for fn, args, kwargs in calls:
+        comp = computation(fn, name="binder_fn")
+        generic = _make_generic_binder(comp.fn_signature, comp.fn_argspec.varkw)
+        try:
+            expected = generic(args, kwargs)
+        except TypeError:
+            with pytest.raises(TypeError):
+                comp.ref(*args, **kwargs)
+            continue
+        ref = comp.ref(*args, **kwargs)
+        assert list(ref.args.items()) == list(expected.items())
+        assert list(ref.key.config) == [k for k in expected if not k.startswith("__")]
+
+    assert computation(Obj().method).ref(1).key.config == {"x": 1, "y": 2}
+    assert computation(Obj(), name="obj").ref(1).key.config == {"x": 1, "y": 2}
+    assert computation(wrapped).ref(1).key.config == {"x": 1, "y": 2}
+
+
+def test_compute_key_memo(store):
+    @computation(key_memo_size=2)
+    def my_fn(x, y=1, __z=None):
+        return x * y
+
+    ref = my_fn.ref(1)
+    assert my_fn.ref(1).key is ref.key
+    assert my_fn.ref(1, __z=2).key is not ref.key
+    assert my_fn.ref(1, __z=2).args == {"x": 1, "y": 1, "__z": 2}
+    assert my_fn.ref(1.0).key.config_key != ref.key.config_key
+    assert my_fn.ref(True).key.config_key != ref.key.config_key
+    zero = my_fn.ref(0.0).key
+    neg_zero = my_fn.ref(-0.0)
+    assert neg_zero.key.config_key != zero.config_key
+    assert math.copysign(1, neg_zero.key.config["x"]) == -1
+    assert math.copysign(1, neg_zero.args["x"]) == -1
+    assert my_fn.ref(y=-0.0, x=1).key.config_key != my_fn.ref(y=0.0, x=1).key.config_key
+    assert my_fn.ref(1, replica=1).key.replica == 1
+    assert my_fn.ref([1]).key.config == {"x": [1], "y": 1}
+    assert len(my_fn._key_memo) <= 2
+
+    with store:
+        assert my_fn(2, 3) == 6
+        assert my_fn(2, 3) == 6
+
+
+def test_compute_iter_replicas(store):
+    @computation
+    def my_fn(x):
+        time.sleep(0.05)
+        return x
+
+    with store:
+        entries = list(my_fn.iter_replicas(5, 10, parallel=3))
+        assert sorted(e.key.replica for e in entries) == list(range(5))
+        assert all(e.result == 10 for e in entries)
+
+        entries = list(my_fn.iter_replicas(3, 20))
+        assert [e.key.replica for e in entries] == [0, 1, 2]
+
+        entries = list(
+            my_fn.iter_replicas(100, 30, parallel=2, until=lambda es: len(es) >= 4)
+        )
+        assert len(entries) == 4
+        stored = my_fn.load_replicas(30)
+        assert 4 <= len(stored) <= 6
+
+
+def test_compute_iter_replicas_nested(store):
+    @computation
+    def outer(x):
+        return sum(e.result for e in inner.iter_replicas(4, x, parallel=2))
+
+    @computation
+    def inner(x):
+        return x
+
+    with store:
+        assert outer(3) == 12
@@ -1,6 +1,16 @@
-from revault.database import Database
+import multiprocessing
+import pickle
+import sqlite3
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+
+from revault.blobs import make_blob
+from revault.database import Database, dispose_engines
+from revault.migrations import SCHEMA_VERSION
 from revault.entry import AnnounceResult
-from revault import Key
+from revault import computation, Key, Store
 
 
 def test_db_announce():
@@ -44,3 +54,174 @@ def test_db_announce():
     assert t[0] == AnnounceResult.COMPUTE_HERE
     assert t[2] is None
     assert t[1] != r[1]
+
+
+BASELINE_SCHEMA = """
+CREATE TABLE entries (
+    id INTEGER NOT NULL,
+    name VARCHAR(80),
+    version INTEGER,
+    config_key VARCHAR(56),
+    replica INTEGER,
+    config BLOB,
+    result BLOB,
+    config_json JSON,
+    result_json JSON,
+    start_date DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    finish_date DATETIME,
+    run_info JSON,
+    PRIMARY KEY (id),
+    UNIQUE (name, version, config_key, replica)
+)
+"""
+
+
+def test_db_migrate_baseline(tmpdir):
+    path = str(tmpdir.join("old.db"))
+    conn = sqlite3.connect(path)
+    conn.execute(BASELINE_SCHEMA)
+    conn.execute(
+        "INSERT INTO entries (name, version, config_key, replica, finish_date) "
+        "VALUES ('test', 1, 'abc', 0, '2024-01-01 00:00:00')"
+    )
+    conn.commit()
+    conn.close()
+
+    db = Database("sqlite:///" + path)
+    db.init()
+    assert db.schema_version() == SCHEMA_VERSION
+    inspector = sa.inspect(db.engine)
+    columns = {c["name"] for c in inspector.get_columns("entries")}
+    assert "result_digest" in columns
+    indexes = {i["name"] for i in inspector.get_indexes("entries")}
+    assert {"ix_entries_unfinished", "ix_entries_name_version_finish"} <= indexes
+    assert inspector.has_table("blobs")
+
+    key = Key("test", 1, {"x": 10}, 0)
+    _, entry_id, _ = db.get_or_announce_entry(key)
+    db.finish_entry(entry_id, "Hello", {}, key.config, blob=make_blob("Hello"))
+    assert db.load_entry(key).result == "Hello"
+
+    dispose_engines()
+    db = Database("sqlite:///" + path)
+    db.init()
+    assert db.schema_version() == SCHEMA_VERSION
+
+
+def test_store_baseline_vault(tmpdir):
+    path = str(tmpdir.join("old.db"))
+    conn = sqlite3.connect(path)
+    conn.execute(BASELINE_SCHEMA)
+    conn.execute(
+        "INSERT INTO entries (name, version, config_key, replica, result, finish_date) "
+        "VALUES ('bl_fn', 0, ?, 0, ?, '2024-01-01 00:00:00')",
+        (Key("bl_fn", 0, {"x": 1}, 0).config_key, pickle.dumps("old")),
+    )
+    conn.commit()
+    conn.close()
+
+    @computation
+    def bl_fn(x):
+        return x * 10
+
+    @computation(dedup_result=True)
+    def bl_dedup(x):
+        return "a" * 100
+
+    with Store("sqlite:///" + path):
+        assert bl_fn(1) == "old"
+        assert bl_fn(3) == 30
+        assert bl_fn.load_replicas(1) == ["old"]
+        assert bl_dedup(1) == bl_dedup(2) == "a" * 100
+    dispose_engines()
+
+
+def test_db_newer_schema(tmpdir):
+    url = "sqlite:///" + str(tmpdir.join("new.db"))
+    db = Database(url)
+    db.init()
+    with db.engine.begin() as conn:
+        conn.execute(sa.update(db.schema_info).values(version=SCHEMA_VERSION + 1))
+    dispose_engines()
+    with pytest.raises(Exception, match="supports only"):
+        Database(url).init()
+    dispose_engines()
+
+
+def test_db_explain():
+    db = Database("sqlite:///:memory:")
+    db.init()
+    c = db.entries.c
+    plan = db.explain(sa.delete(db.entries).where(c.finish_date == None))
+    assert any("ix_entries_unfinished" in line for line in plan)
+    plan = db.explain(
+        sa.select(c.id)
+        .where(c.name == "x")
+        .where(c.version == 1)
+        .where(c.finish_date > datetime(2024, 1, 1))
+    )
+    assert any("ix_entries_name_version_finish" in line for line in plan)
+    assert db.explain("SELECT * FROM entries")
+
+
+def test_db_load_replicas_many_chunks(monkeypatch):
+    monkeypatch.setattr("revault.database._IN_CHUNK_SIZE", 3)
+    db = Database("sqlite:///:memory:")
+    db.init()
+
+    keys = [Key("many", 0, {"x": x}, 0) for x in range(10)]
+    for key in keys[:8]:
+        for replica in range(2):
+            _, entry_id, _ = db.get_or_announce_entry(
+                Key(key.name, key.version, key.config, replica)
+            )
+            db.finish_entry(entry_id, (key.config["x"], replica), {}, key.config)
+
+    loaded = db.load_replicas_many(keys + keys[:2], threads=2)
+    assert list(loaded) == keys
+    assert [loaded[key] for key in keys] == [[(x, 0), (x, 1)] for x in range(8)] + [
+        [],
+        [],
+    ]
+
+
+def _init_process(url, barrier, queue):
+    barrier.wait(timeout=60)
+    try:
+        Database(url).init()
+        queue.put(None)
+    except Exception as e:
+        queue.put(repr(e))
+
+
+@pytest.mark.parametrize("baseline", [False, True])
+def test_db_concurrent_init(tmpdir, baseline):
+    path = str(tmpdir.join("test.db"))
+    if baseline:
+        conn = sqlite3.connect(path)
+        conn.execute(BASELINE_SCHEMA)
+        conn.commit()
+        conn.close()
+    url = "sqlite:///" + path
+
+    processes = 8
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    barrier = context.Barrier(processes)
+    pool = [
+        context.Process(target=_init_process, args=(url, barrier, queue))
+        for _ in range(processes)
+    ]
+    for process in pool:
+        process.start()
+    errors = [queue.get(timeout=120) for _ in pool]
+    for process in pool:
+        process.join()
+    assert errors == [None] * processes
+
+    db = Database(url)
+    db.init()
+    with db.engine.connect() as conn:
+        rows = conn.execute(sa.select(db.schema_info)).all()
+    assert rows == [(1, SCHEMA_VERSION)]
+    dispose_engines()
@@ -0,0 +1,67 @@
+import pytest
+
+from revault import computation
+
+pd = pytest.importorskip("pandas")
+
+
+def test_to_frame(store):
+    @computation
+    def fr_fn(x, opts, **kw):
+        return [x, x]
+
+    with store:
+        fr_fn(1, {"a": 1.5, "b": {"c": "x"}})
+        fr_fn(2, {"a": 2, "b": {"c": "y"}}, replica=1)
+        fr_fn(3, {"a": 3.5, "b": {"c": "z"}}, extra=True)
+
+        frame = fr_fn.to_frame(chunk_size=2)
+        frame = frame.sort_values("x").reset_index(drop=True)
+        assert sorted(frame.columns) == [
+            "extra",
+            "opts.a",
+            "opts.b.c",
+            "replica",
+            "result",
+            "x",
+        ]
+        assert frame["x"].dtype == "int64"
+        assert frame["opts.a"].dtype == "float64"
+        assert frame["opts.b.c"].tolist() == ["x", "y", "z"]
+        assert frame["replica"].tolist() == [0, 1, 0]
+        assert frame["result"].tolist() == [[1, 1], [2, 2], [3, 3]]
+        assert frame["extra"].tolist() == [None, None, True]
+
+        frame = fr_fn.to_frame(replicas=False)
+        assert sorted(frame["x"]) == [1, 3]
+
+
+def test_to_frame_metadata(store):
+    @computation
+    def fr_meta(x):
+        raise Exception("Not called")
+
+    with store:
+        store.insert_new_replica(fr_meta.ref(1), "a")
+        frame = fr_meta.to_frame(fields=["config", "finish_date"])
+        assert list(frame.columns) == ["x", "finish_date"]
+        assert len(frame) == 1
+
+        frame = fr_meta.to_frame(fields=["replica", "start_date"])
+        assert list(frame.columns) == ["replica", "start_date"]
+
+        assert len(fr_meta.to_frame(fields=["result"], replicas=False)) == 1
+
+        with pytest.raises(Exception, match="Invalid field"):
+            fr_meta.to_frame(fields=["xyz"])
+
+
+def test_to_frame_empty(store):
+    @computation
+    def fr_empty(x):
+        return x
+
+    with store:
+        frame = fr_empty.to_frame()
+        assert list(frame.columns) == ["replica", "result"]
+        assert len(frame) == 0
@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+from revault import computation
+from revault.hooks import Histogram, SpanRecorder, StatsCollector
+from revault.store import _TimedBackend
+
+
+def test_hooks_stats(store):
+    @computation
+    def hk_fn(x):
+        if x < 0:
+            raise Exception("Negative")
+        return x
+
+    stats = StatsCollector()
+    store.add_hook(stats)
+    with store:
+        hk_fn(1)
+        hk_fn(1)
+        hk_fn(2)
+        with pytest.raises(Exception, match="Negative"):
+            hk_fn(-1)
+        hk_fn.load(1)
+
+    assert stats.counters["hit"] == 1
+    assert stats.counters["miss"] == 3
+    assert stats.counters["compute"] == 3
+    assert stats.counters["error"] == 1
+    assert stats.counters["db.get_or_announce_entry"] == 4
+    assert stats.counters["db.finish_entry"] == 2
+    assert stats.counters["db.cancel_entry"] == 1
+    assert stats.counters["db.load_entry"] == 1
+    assert stats.histograms["compute"].count == 3
+    assert stats.summary()["histograms"]["db.load_entry"]["count"] == 1
+
+    store.remove_hook(stats)
+    assert not isinstance(store.db, _TimedBackend)
+    store.remove_hook(stats)
+    with store:
+        hk_fn(3)
+    assert stats.counters["miss"] == 3
+
+
+def test_hooks_spans(store):
+    @computation
+    def hk_outer(x):
+        return hk_inner(x) + hk_inner(x + 1)
+
+    @computation
+    def hk_inner(x):
+        return x
+
+    exported = []
+    recorder = SpanRecorder(export=exported.append)
+    store.add_hook(recorder)
+    with store:
+        hk_outer(1)
+
+    assert exported == recorder.spans
+    computes = {s.name: s for s in recorder.spans if s.name.startswith("compute")}
+    spans = [s for s in recorder.spans if s.name == "compute hk_inner"]
+    assert len(spans) == 2
+    outer = computes["compute hk_outer"]
+    assert outer.parent_span_id is None
+    for span in spans:
+        assert span.parent_span_id == outer.span_id
+        assert span.trace_id == outer.trace_id
+        assert span.attributes["revault.name"] == "hk_inner"
+    db_spans = [s for s in recorder.spans if s.name == "db get_or_announce_entry"]
+    assert [s.parent_span_id for s in db_spans] == [None, outer.span_id, outer.span_id]
+    assert outer.to_dict()["spanId"] == outer.span_id
+
+
+def test_histogram():
+    h = Histogram()
+    assert h.quantile(0.5) is None
+    for value in [0.001] * 99 + [10.0]:
+        h.add(value)
+    assert 0.001 <= h.quantile(0.5) < 0.002
+    assert h.quantile(1.0) >= 10.0
+    assert h.max == 10.0
+
+
+def test_hooks_time_iterators(store, monkeypatch):
+    @computation
+    def hk_iter(x):
+        return x
+
+    with store:
+        for x in range(3):
+            hk_iter(x)
+
+    original = store.db.load_key_tuples
+
+    def slow_load_key_tuples(names):
+        for item in original(names):
+            time.sleep(0.02)
+            yield item
+
+    monkeypatch.setattr(store.db, "load_key_tuples", slow_load_key_tuples)
+    stats = StatsCollector()
+    store.add_hook(stats)
+    store.snapshot_index()
+    assert stats.counters["db.load_key_tuples"] == 1
+    assert stats.histograms["db.load_key_tuples"].sum >= 0.05
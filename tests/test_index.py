@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+from revault import computation, Key, Store
+from revault.index import BloomFilter, KeyIndex
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(1000)
+    for i in range(1000):
+        bloom.add(("f", str(i), 0, 0))
+    assert all(("f", str(i), 0, 0) in bloom for i in range(1000))
+    false_positives = sum(("g", str(i), 0, 0) in bloom for i in range(1000))
+    assert false_positives < 50
+
+
+@pytest.mark.parametrize("bloom", [False, True])
+def test_snapshot_index(store, bloom):
+    counter = [0]
+
+    @computation
+    def idx_fn(x):
+        counter[0] += 1
+        return x * 10
+
+    @computation
+    def idx_other(x):
+        return x
+
+    with store:
+        idx_fn(1)
+        idx_other(1)
+        index = store.snapshot_index(["idx_fn"], bloom=bloom)
+        assert index.contains(idx_fn.ref(1).key) is (None if bloom else True)
+        assert index.contains(idx_fn.ref(2).key) is False
+        assert index.contains(idx_other.ref(1).key) is None
+
+        assert idx_fn.exists(1)
+        assert not idx_fn.exists(2)
+        assert idx_other.exists(1)
+        assert idx_fn.load_or_none(2) is None
+        assert idx_fn.load(1) == 10
+
+        assert idx_fn(2) == 20
+        assert counter[0] == 2
+        assert idx_fn.exists(2)
+        assert idx_fn(2) == 20
+        assert counter[0] == 2
+
+        new_key = store.insert_new_replica(idx_fn.ref(3), 7)
+        assert store.contains(new_key)
+
+        idx_fn.remove(2)
+        assert not idx_fn.exists(2)
+        assert store.remove_where("idx_fn") == 2
+        assert not idx_fn.exists(1)
+        assert idx_fn.load_or_none(1) is None
+
+
+def test_snapshot_index_refresh(tmpdir):
+    url = "sqlite:///" + str(tmpdir.join("test.db"))
+    store1 = Store(url)
+    store2 = Store(url)
+
+    @computation
+    def idx_shared(x):
+        return x
+
+    index = store1.snapshot_index(refresh_interval=None)
+    with store2:
+        idx_shared(1)
+    with store1:
+        # Stale snapshot does not see entries of other stores
+        assert idx_shared.load_or_none(1) is None
+        index.invalidate()
+        assert idx_shared.load_or_none(1) == 1
+        # Computing with a stale snapshot falls back to the stored entry
+        with store2:
+            idx_shared(2)
+        assert idx_shared(2) == 2
+
+
+def test_index_changes_during_reload():
+    new_key = Key("ix", 0, {"x": 1}, 0)
+    old_key = Key("ix", 0, {"x": 2}, 0)
+    index = None
+
+    def load(names):
+        # Local writes that happen while the snapshot is read
+        if index is not None:
+            index.add(new_key)
+            index.discard(old_key)
+        return [old_key.tuple_key]
+
+    index = KeyIndex(load)
+    assert index.contains(old_key) is True
+    index.reload()
+    assert index.contains(new_key) is True
+    assert index.contains(old_key) is False
+
+
+def test_index_reload_outside_store_lock(store, monkeypatch):
+    @computation
+    def idx_lock(x):
+        return x
+
+    original = store.db.load_key_tuples
+
+    def load_key_tuples(names):
+        assert not store.lock.locked()
+        return original(names)
+
+    monkeypatch.setattr(store.db, "load_key_tuples", load_key_tuples)
+    store.snapshot_index(refresh_interval=0)
+    with store:
+        time.sleep(0.01)
+        assert idx_lock(1) == 1
+        assert idx_lock.load(1) == 1
@@ -0,0 +1,18 @@
+from revault.loadtest import run_loadtest, main
+
+
+def test_loadtest(tmpdir):
+    url = "sqlite:///" + str(tmpdir.join("test.db"))
+    report = run_loadtest(url, processes=2, threads=2, keys=10, calls=10)
+    assert report.calls == 40
+    assert report.duplicates == 0
+    assert 1 <= report.computations <= 10
+    assert sum(report.outcomes.values()) == 40
+    assert report.latency(0.5) <= report.latency(1.0)
+    assert "duplicates: 0" in report.format()
+
+
+def test_loadtest_main(tmpdir, capsys):
+    url = "sqlite:///" + str(tmpdir.join("test.db"))
+    main([url, "--processes", "1", "--threads", "2", "--calls", "5"])
+    assert "calls:        10" in capsys.readouterr().out
@@ -1,4 +1,10 @@
-from revault import computation
+import subprocess
+import sys
+from datetime import datetime
+
+import pytest
+
+from revault import computation, Store
 
 
 def test_runtime_insert_new_replica(store):
@@ -38,3 +44,123 @@ def test_remove(store):
         assert counter[0] == 3
         my_fn(20)
         assert counter[0] == 3
+
+
+def test_store_engine_cached(tmpdir):
+    url = "sqlite:///" + str(tmpdir.join("test.db"))
+    assert Store(url).db.engine is Store(url).db.engine
+    assert Store("sqlite://").db.engine is not Store("sqlite://").db.engine
+
+
+def test_import_is_lazy():
+    code = "import sys, revault; assert 'sqlalchemy' not in sys.modules"
+    subprocess.check_call([sys.executable, "-c", code])
+
+
+def test_remove_where(store):
+    def make(version):
+        @computation(name="rw_fn", version=version)
+        def rw_fn(x):
+            return x * 10
+
+        return rw_fn
+
+    comps = [make(v) for v in (0, 1, 3)]
+    with store:
+        for comp in comps:
+            for x in range(3):
+                comp(x)
+        assert store.list_versions("rw_fn") == [0, 1, 3]
+
+        with pytest.raises(Exception, match="condition"):
+            store.remove_where()
+
+        assert store.remove_where("rw_fn", finished_before=datetime(2000, 1, 1)) == 0
+        assert store.remove_where("rw_fn", version=1) == 3
+        assert comps[1].load_or_none(0) is None
+        assert comps[0].load(0) == 0
+
+        assert comps[2].prune_versions(keep=1) == 3
+        assert store.list_versions("rw_fn") == [3]
+        assert comps[2].prune_versions() == 0
+        assert comps[2].load(2) == 20
+
+        freed = store.compact()
+        assert isinstance(freed, int) and freed >= 0
+        assert comps[2].load(1) == 10
+
+
+def test_remove_where_keeps_running(store):
+    @computation
+    def rw_running(x):
+        if x == 1:
+            # Removal of other entries while this one is being computed
+            assert store.remove_where("rw_running") == 1
+        return x
+
+    with store:
+        rw_running(0)
+        assert rw_running(1) == 1
+        assert rw_running.load_or_none(1) == 1
+        assert rw_running.load_or_none(0) is None
+
+
+def test_compact_frees_space(tmpdir):
+    for url in [
+        "sqlite:///" + str(tmpdir.join("test.db")),
+        "file://" + str(tmpdir.join("test.log")),
+    ]:
+
+        @computation
+        def big(x):
+            return "x" * 100_000
+
+        store = Store(url)
+        with store:
+            for i in range(20):
+                big(i)
+            assert store.remove_where("big") == 20
+            assert store.compact() > 1_000_000
+            assert big.load_or_none(1) is None
+            assert big(1) == "x" * 100_000
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_load_replicas_many(store, threads):
+    @computation
+    def grid_fn(x, y):
+        return {"sum": x + y}
+
+    @computation(dedup_result=True)
+    def grid_dedup(x):
+        return [x % 2] * 100
+
+    with store:
+        for x in range(3):
+            grid_fn.replicas(x + 1, x=x, y=1)
+        grid_fn(0, 2, version=1)
+        for x in range(4):
+            grid_dedup(x)
+        store.insert_new_replica(grid_dedup.ref(0), None)
+
+        grid = [{"x": x, "y": 1} for x in range(4)]
+        loaded = grid_fn.load_grid(grid, threads=threads)
+        assert [key.config for key in loaded] == grid
+        assert list(loaded.values()) == [
+            [{"sum": 1}],
+            [{"sum": 2}] * 2,
+            [{"sum": 3}] * 3,
+            [],
+        ]
+        for key, results in loaded.items():
+            assert results == grid_fn.load_replicas(**key.config)
+
+        refs = [grid_dedup.ref(x) for x in range(4)] + [grid_fn.ref(0, 2, version=1)]
+        loaded = store.load_replicas_many(refs, threads=threads)
+        assert loaded == {
+            refs[0].key: [[0] * 100, None],
+            refs[1].key: [[1] * 100],
+            refs[2].key: [[0] * 100],
+            refs[3].key: [[1] * 100],
+            refs[4].key: [{"sum": 2}],
+        }
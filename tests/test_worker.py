@@ -0,0 +1,134 @@
+import threading
+import time
+
+from revault import computation
+from revault.worker import run_worker
+
+
+def test_worker_queue(store):
+    counter = [0]
+
+    @computation
+    def wq_fn(x, y=1):
+        counter[0] += 1
+        return x * y
+
+    with store:
+        assert wq_fn.enqueue(10, 2) == 1
+        assert wq_fn.enqueue(10, y=2) == 0
+        assert wq_fn.enqueue_replicas(2, 3) == 2
+
+    assert run_worker(store) == 3
+    assert run_worker(store) == 0
+    assert counter[0] == 3
+
+    with store:
+        assert wq_fn.load(10, 2) == 20
+        assert wq_fn.load_replicas(3) == [3, 3]
+
+
+def test_worker_failed_task(store):
+    @computation
+    def wq_fail(x):
+        if x == 1:
+            raise Exception("Failed")
+        return x
+
+    with store:
+        wq_fail.enqueue(1)
+        wq_fail.enqueue(2)
+
+    assert run_worker(store) == 2
+    assert store.claim_task("w") is None
+    with store:
+        assert wq_fail.load_or_none(1) is None
+        assert wq_fail.load(2) == 2
+
+
+def test_worker_claim_once(store):
+    @computation
+    def wq_claim(x):
+        return x
+
+    with store:
+        wq_claim.enqueue_replicas(20, 1)
+
+    claimed = []
+
+    def claim():
+        while True:
+            task = store.claim_task(threading.current_thread().name)
+            if task is None:
+                break
+            claimed.append(task[1])
+
+    threads = [threading.Thread(target=claim) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(key.replica for key in claimed) == list(range(20))
+
+
+def test_worker_lease(store):
+    @computation
+    def wq_lease(x):
+        return x
+
+    with store:
+        wq_lease.enqueue(1)
+
+    # A worker claims a task, starts computing it and dies
+    task_id, key = store.claim_task("dead", lease=60)
+    store.db.get_or_announce_entry(key)
+    assert store.claim_task("other", lease=60) is None
+
+    time.sleep(0.1)
+    store.renew_task(task_id)
+    assert store.claim_task("other", lease=0.05) is None
+    time.sleep(0.1)
+    assert run_worker(store, lease=0.05) == 1
+    with store:
+        assert wq_lease.load(1) == 1
+    assert run_worker(store, lease=0.05) == 0
+
+
+def test_worker_requeue_failed(store):
+    fail = [True]
+
+    @computation
+    def wq_requeue(x):
+        if fail[0]:
+            raise Exception("Failed")
+        return x
+
+    with store:
+        wq_requeue.enqueue(1)
+
+    assert run_worker(store, lease=0.05) == 1
+    time.sleep(0.1)
+    # Failed tasks are not taken over
+    assert store.claim_task("w", lease=0.05) is None
+    assert store.requeue_failed_tasks("other") == 0
+    assert store.requeue_failed_tasks("wq_requeue") == 1
+    assert store.requeue_failed_tasks() == 0
+    fail[0] = False
+    assert run_worker(store) == 1
+    with store:
+        assert wq_requeue.load(1) == 1
+
+
+def test_worker_renews_lease(store):
+    taken_over = []
+
+    @computation
+    def wq_slow(x):
+        time.sleep(0.3)
+        taken_over.append(store.claim_task("other", lease=0.1))
+        return x
+
+    with store:
+        wq_slow.enqueue(1)
+
+    assert run_worker(store, lease=0.1) == 1
+    assert taken_over == [None]